@@ -1,5 +1,6 @@
+import hmac
 import os
-from flask import Flask
+from flask import Flask, abort, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
@@ -17,6 +18,10 @@ login_manager = LoginManager()
 def create_app(config_class=None):
     app = Flask(__name__, instance_relative_config=True)
 
+    # Stream uploaded files to disk instead of buffering them in memory
+    from app.services.upload_service import UploadRequest
+    app.request_class = UploadRequest
+
     # Load configuration
     if config_class is None:
         app.config.from_object('app.config.Config')
@@ -29,6 +34,10 @@ def create_app(config_class=None):
     except OSError:
         pass
 
+    # Refuse to decode anything past the largest plan's pixel ceiling (decompression bomb guard)
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = app.config['PAID_USER_MAX_RESOLUTION'] ** 2
+
     # Initialize extensions with app
     db.init_app(app)
     migrate.init_app(app, db)
@@ -50,8 +59,28 @@ def create_app(config_class=None):
     # Import models to ensure they're known to Flask-Migrate
     from app import models
 
+    # Create the Google Vision client once per process instead of once per image
+    if app.config.get('VISION_WARM_CLIENT'):
+        try:
+            from app.services.google_vision_service import warm_vision_client
+            warm_vision_client(app)
+        except ImportError:
+            app.logger.warning("Google Vision library not installed, skipping client warm-up")
+
     @app.route('/health')
     def health_check():
         return {'status': 'ok'}
 
+    @app.route('/metrics')
+    def metrics_snapshot():
+        # Cache hit rates, queue depths and API latencies are for internal scrapers only
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode()):
+            abort(401)
+
+        from app.services import metrics
+        return metrics.snapshot()
+
     return app
\ No newline at end of file
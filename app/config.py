@@ -11,6 +11,35 @@ class Config:
 
     # Google Vision API
     GOOGLE_VISION_KEY = os.environ.get('GOOGLE_VISION_KEY')
+    VISION_WARM_CLIENT = os.environ.get('VISION_WARM_CLIENT', 'True').lower() == 'true'  # Create client at startup
+    VISION_BATCH_SIZE = int(os.environ.get('VISION_BATCH_SIZE', 16))  # Images per batch_annotate_images call (max 16)
+    VISION_BATCH_MAX_BYTES = int(os.environ.get('VISION_BATCH_MAX_BYTES', 8 * 1024 * 1024))  # Payload cap per call
+
+    # Preprocessing before OCR: downscale to ~300 DPI on A4/letter, grayscale, JPEG
+    PREPROCESS_ENABLED = os.environ.get('PREPROCESS_ENABLED', 'True').lower() == 'true'
+    PREPROCESS_MAX_SIDE = int(os.environ.get('PREPROCESS_MAX_SIDE', 3508))  # Longest side in pixels
+    PREPROCESS_QUALITY = int(os.environ.get('PREPROCESS_QUALITY', 85))  # JPEG quality
+    PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', 2))  # Processes per job worker
+
+    # Multi-page TIFF and PDF uploads
+    MAX_DOCUMENT_PAGES = int(os.environ.get('MAX_DOCUMENT_PAGES', 50))  # Pages OCR'd per document
+    PAGE_MAX_WORKERS = int(os.environ.get('PAGE_MAX_WORKERS', 4))  # Concurrent Vision requests per document
+
+    # OCR result cache, keyed by the SHA-256 of the uploaded image and its language
+    OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'True').lower() == 'true'
+    OCR_CACHE_DIR = os.environ.get('OCR_CACHE_DIR',
+                                   os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                'instance', 'ocr_cache'))
+    OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # 512 MB
+    OCR_CACHE_TTL = int(os.environ.get('OCR_CACHE_TTL', 30 * 24 * 3600))  # 30 days
+
+    # Rendered output cache, keyed by the OCR data, output format and generator version
+    RENDER_CACHE_ENABLED = os.environ.get('RENDER_CACHE_ENABLED', 'True').lower() == 'true'
+    RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR',
+                                      os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                   'instance', 'render_cache'))
+    RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 2 GB disk quota
+    RENDER_CACHE_TTL = int(os.environ.get('RENDER_CACHE_TTL', 30 * 24 * 3600))  # 30 days
 
     # OCR Settings
     OCR_PROVIDER = 'google_vision'  # We'll use Google Vision for OCRimport os
@@ -29,15 +58,37 @@ class Config:
 
     # File limits for free users
     FREE_USER_MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
-    FREE_USER_MAX_RESOLUTION = 1024  # 1024x1024 pixels
+    FREE_USER_MAX_RESOLUTION = 2048  # 2048x2048 pixels
 
     # File limits for paid users
     PAID_USER_MAX_FILE_SIZE = 20 * 1024 * 1024  # 20 MB
-    PAID_USER_MAX_RESOLUTION = 6200  # 6200x6200 pixels
+    PAID_USER_MAX_RESOLUTION = 6200  # 6200x6200 pixels, also the decompression bomb limit
 
     # Batch processing settings
     BATCH_PROCESSING_ENABLED = True
     MAX_BATCH_SIZE = 10  # Maximum number of files in a batch
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))  # Documents processed in parallel per batch
+
+    # Background job queue (run workers with `python worker.py`)
+    JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND', 'sqlite')  # 'sqlite' or 'redis'
+    JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH',
+                                    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                 'instance', 'jobs.sqlite3'))
+    JOB_QUEUE_URL = os.environ.get('JOB_QUEUE_URL', 'redis://localhost:6379/0')  # Used by the redis backend
+    JOB_VISIBILITY_TIMEOUT = int(os.environ.get('JOB_VISIBILITY_TIMEOUT', 600))  # Requeue jobs stuck this long (s)
+    WORKER_POLL_INTERVAL = float(os.environ.get('WORKER_POLL_INTERVAL', 1.0))  # Seconds between empty polls
+
+    # /metrics is served only to requests sending "Authorization: Bearer <token>"; it is off when unset
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Downloads: '' sends files from Python, 'nginx' uses X-Accel-Redirect, 'sendfile' uses X-Sendfile
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '')
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-downloads/')  # nginx internal location
+
+    # Live status updates (Server-Sent Events)
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))  # Seconds between event log reads
+    SSE_HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))  # Keep-alive comment every N seconds
+    SSE_MAX_DURATION = int(os.environ.get('SSE_MAX_DURATION', 300))  # Close streams after N seconds; clients reconnect
 
     # Regional settings
     DEFAULT_CURRENCY = os.environ.get('DEFAULT_CURRENCY', 'USD')  # USD or INR
@@ -66,7 +117,10 @@ class Config:
     # File Upload settings
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_SIZE', 262144000))  # 250 MB
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
-    ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'webp'}
+    ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'webp', 'pdf'}
+
+    # Plans are cached in memory; changes made by other processes show up after this long
+    PLAN_CACHE_TTL = int(os.environ.get('PLAN_CACHE_TTL', 60))  # Seconds
 
     # App settings
     FREE_USER_ATTEMPTS = int(os.environ.get('FREE_USER_ATTEMPTS', 5))
@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta
 
+from flask import current_app
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
 import app
 from app import db, login_manager
+from app.services import plan_cache
 import json
 
 
@@ -15,6 +17,9 @@ def load_user(user_id):
 
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_subscription_id', 'subscription_id'),  # Stripe webhooks
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -33,6 +38,7 @@ class User(db.Model, UserMixin):
 
     # Usage tracking
     usage_count = db.Column(db.Integer, default=0)  # Total lifetime usage
+    document_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Documents uploaded
     monthly_usage = db.Column(db.Integer, default=0)  # Current month usage
     usage_reset_date = db.Column(db.DateTime, nullable=True)  # Date to reset monthly usage
     documents_limit = db.Column(db.Integer, default=5)  # Current document limit
@@ -67,59 +73,81 @@ class User(db.Model, UserMixin):
             return False
         return check_password_hash(self.password_hash, password)
 
-    def can_process_document(self):
+    def get_plan(self):
         """
-        Check if user can process a document based on their subscription and limits
+        Get the plan that applies to the user
 
         Returns:
-            tuple: (can_process, message)
+            CachedPlan: The free plan or the user's subscription plan (a read-only copy from
+                the plan cache), or None if it doesn't exist
         """
-        # Get current time for checks
-        now = datetime.utcnow()
+        plan_name = self.subscription_type if self.is_paid_user else 'free'
+        return plan_cache.get_plan(plan_name)
 
+    def get_max_file_size(self):
+        """
+        Get the largest file the user may upload
 
-        # Reset daily count if needed for all users
-        today = now.date()
-        if self.last_daily_reset is None or self.last_daily_reset.date() < today:
-            self.daily_conversion_count = 0
-            self.last_daily_reset = now
-            db.session.commit()
+        Returns:
+            int: Size limit in bytes, from the user's plan or the configured defaults
+        """
+        plan = self.get_plan()
+        if plan and plan.max_file_size:
+            return plan.max_file_size
+        return current_app.config['PAID_USER_MAX_FILE_SIZE' if self.is_paid_user else 'FREE_USER_MAX_FILE_SIZE']
 
-        # Reset monthly count if needed for ALL users (including free)
-        if self.usage_reset_date and self.usage_reset_date <= now:
-            self.monthly_conversion_count = 0
-            self.usage_reset_date = now + timedelta(days=30)
-            db.session.commit()
+    def get_usage_limits(self):
+        """
+        Get the user's monthly and daily conversion limits
 
-        # Get the user's plan
-        from app.models import Plan
-        if not self.is_paid_user:
-            plan = Plan.query.filter_by(name='free').first()
-        else:
-            plan = Plan.query.filter_by(name=self.subscription_type).first()
+        Returns:
+            tuple: (document_limit, daily_limit)
+        """
+        plan = self.get_plan()
 
         if not plan:
             # Fallback to defaults if plan not found
-            document_limit = 5
-            daily_limit = 5
-        else:
-            document_limit = plan.document_limit
-            # Daily limit from plan or calculate based on monthly limit
-            daily_limit = getattr(plan, 'daily_limit', None) or (5 if plan.name == 'free' else
-                                                                 50000 if plan.name == 'yearly' else 3000)
+            return 5, 5
+
+        # Daily limit from plan or calculate based on monthly limit
+        daily_limit = getattr(plan, 'daily_limit', None) or (5 if plan.name == 'free' else
+                                                             50000 if plan.name == 'yearly' else 3000)
+        return plan.document_limit, daily_limit
+
+    def _current_usage(self, now):
+        """Monthly and daily counts as they stand after any reset that is due"""
+        daily = self.daily_conversion_count or 0
+        if self.last_daily_reset is None or self.last_daily_reset.date() < now.date():
+            daily = 0
+        monthly = self.monthly_conversion_count or 0
+        if self.usage_reset_date and self.usage_reset_date <= now:
+            monthly = 0
+        return monthly, daily
+
+    def can_process_document(self):
+        """
+        Check if user can process a document based on their subscription and limits
+
+        This is a read-only pre-check; reserve_usage applies the limits atomically
+        when the documents are created.
+
+        Returns:
+            tuple: (can_process, message)
+        """
+        # Get current time for checks
+        now = datetime.utcnow()
+
+        # Daily and monthly counts that are due for a reset count as zero
+        monthly_count, daily_count = self._current_usage(now)
+        document_limit, daily_limit = self.get_usage_limits()
 
         # For free users, check monthly limit instead of lifetime
         if not self.is_paid_user:
-            # Ensure free users have a reset date set
-            if not self.usage_reset_date:
-                self.usage_reset_date = now + timedelta(days=30)
-                db.session.commit()
-
-            if self.monthly_conversion_count >= document_limit:
-                days_until_reset = (self.usage_reset_date - now).days
+            if monthly_count >= document_limit:
+                days_until_reset = (self.usage_reset_date - now).days if self.usage_reset_date else 30
                 return False, f"You've reached your monthly free limit of {document_limit} conversions. Limit resets in {days_until_reset} days."
 
-            if self.daily_conversion_count >= daily_limit:
+            if daily_count >= daily_limit:
                 return False, f"You've reached your daily conversion limit of {daily_limit}."
 
             return True, None
@@ -128,11 +156,11 @@ class User(db.Model, UserMixin):
         if self.is_paid_user and self.subscription_status == 'active':
             if self.subscription_end_date and self.subscription_end_date > now:
                 # Check monthly usage
-                if self.monthly_conversion_count >= document_limit:
+                if monthly_count >= document_limit:
                     return False, f"You've reached your monthly limit of {document_limit} conversions."
 
                 # Check daily usage
-                if self.daily_conversion_count >= daily_limit:
+                if daily_count >= daily_limit:
                     return False, f"You've reached today's limit of {daily_limit} conversions."
 
                 return True, None
@@ -146,6 +174,67 @@ class User(db.Model, UserMixin):
         # Default fallback
         return False, "Unknown subscription status. Please contact support."
 
+    def reserve_usage(self, units):
+        """
+        Reset, check and reserve conversion quota in a single conditional UPDATE
+
+        The due daily and monthly resets, every limit check and the increment all
+        happen in one statement, so concurrent uploads can't both pass the check
+        and overshoot the limit. The same statement adds the units to the user's
+        document_count. The caller commits, together with the documents the units
+        are reserved for.
+
+        Args:
+            units (int): Number of conversions to reserve
+
+        Returns:
+            tuple: (reserved, message) where message explains a refusal
+        """
+        now = datetime.utcnow()
+        today = datetime(now.year, now.month, now.day)
+        document_limit, daily_limit = self.get_usage_limits()
+
+        daily_due = db.or_(User.last_daily_reset.is_(None), User.last_daily_reset < today)
+        monthly_due = db.and_(User.usage_reset_date.isnot(None), User.usage_reset_date <= now)
+        daily_count = db.case((daily_due, 0), else_=db.func.coalesce(User.daily_conversion_count, 0))
+        monthly_count = db.case((monthly_due, 0), else_=db.func.coalesce(User.monthly_conversion_count, 0))
+        usage_count = db.func.coalesce(User.usage_count, 0)
+
+        conditions = [
+            User.id == self.id,
+            monthly_count + units <= document_limit,
+            daily_count + units <= daily_limit
+        ]
+        if not self.is_paid_user:
+            conditions.append(usage_count + units <= current_app.config['FREE_USER_ATTEMPTS'])
+
+        result = db.session.execute(
+            db.update(User).where(*conditions).values({
+                User.daily_conversion_count: daily_count + units,
+                User.last_daily_reset: db.case((daily_due, now), else_=User.last_daily_reset),
+                User.monthly_conversion_count: monthly_count + units,
+                User.usage_reset_date: db.case(
+                    (db.or_(User.usage_reset_date.is_(None), monthly_due), now + timedelta(days=30)),
+                    else_=User.usage_reset_date
+                ),
+                User.usage_count: usage_count + units,
+                User.document_count: User.document_count + units,
+                User.last_used: now
+            }).execution_options(synchronize_session=False)
+        )
+        db.session.expire(self, ['daily_conversion_count', 'last_daily_reset', 'monthly_conversion_count',
+                                 'usage_reset_date', 'usage_count', 'document_count', 'last_used'])
+        if result.rowcount == 1:
+            return True, None
+
+        # Refused: report how much is left, as of the row we just failed to update
+        monthly_count, daily_count = self._current_usage(now)
+        remaining = min(document_limit - monthly_count, daily_limit - daily_count)
+        if not self.is_paid_user:
+            remaining = min(remaining, current_app.config['FREE_USER_ATTEMPTS'] - (self.usage_count or 0))
+        remaining = max(remaining, 0)
+        return False, f"Your plan has {remaining} conversions left right now, but {units} documents were uploaded."
+
     def increment_usage(self):
         """Increment usage counters"""
         self.usage_count += 1
@@ -169,6 +258,11 @@ class User(db.Model, UserMixin):
 
 class Document(db.Model):
     __tablename__ = 'documents'
+    __table_args__ = (
+        # Dashboard, documents list (paged by created_at, id)
+        db.Index('ix_documents_user_id_created_at_id', 'user_id', db.desc('created_at'), db.desc('id')),
+        db.Index('ix_documents_batch_id_batch_order', 'batch_id', 'batch_order'),  # Batch pages and workers
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -178,11 +272,12 @@ class Document(db.Model):
     file_type = db.Column(db.String(10), nullable=False)  # docx, pdf, xlsx
     language = db.Column(db.String(10), default='en')  # Language code
     ocr_provider = db.Column(db.String(20), default='google_vision')  # Always using Google Vision
-    structured_data = db.Column(db.Text, nullable=True)  # JSON string for structured OCR data
     file_size = db.Column(db.Integer, nullable=False)  # in bytes
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the uploaded file, for the OCR cache
+    preprocessed_size = db.Column(db.Integer, nullable=True)  # Bytes sent for OCR after preprocessing
     status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed
     anthropic_request_id = db.Column(db.String(120), nullable=True)
-    error_message = db.Column(db.Text, nullable=True)
+    error_message = db.deferred(db.Column(db.Text, nullable=True))  # Loaded on first access only
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -193,10 +288,38 @@ class Document(db.Model):
     batch_id = db.Column(db.String(36), db.ForeignKey('batch_processes.id'), nullable=True)
     batch_order = db.Column(db.Integer, nullable=True)  # Order within a batch
 
+    # Structured OCR data lives in its own table so document rows stay small
+    data = db.relationship('DocumentData', uselist=False, lazy=True, cascade='all, delete-orphan')
+
+    def set_structured_data(self, structured_data):
+        from app.services.ocr_storage import pack
+        blob = pack(structured_data)
+        if self.data is None:
+            self.data = DocumentData(structured_data=blob)
+        else:
+            self.data.structured_data = blob
+
+    def get_structured_data(self):
+        from app.services.ocr_storage import unpack
+        return unpack(self.data.structured_data) if self.data and self.data.structured_data else None
+
     def __repr__(self):
         return f'<Document {self.original_filename}>'
 
 
+class DocumentData(db.Model):
+    """Structured OCR data for a document, stored as a compact binary blob (see ocr_storage.py)"""
+    __tablename__ = 'document_data'
+
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), primary_key=True)
+    structured_data = db.Column(db.LargeBinary(length=(2 ** 32) - 1), nullable=True)  # LONGBLOB on MySQL
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DocumentData {self.document_id}>'
+
+
 class Plan(db.Model):
     __tablename__ = 'plans'
 
@@ -243,6 +366,10 @@ class Plan(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_user_id_created_at', 'user_id', db.desc('created_at')),  # Billing history
+        db.Index('ix_payments_stripe_payment_id', 'stripe_payment_id'),  # Invoice lookup
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -262,6 +389,9 @@ class Payment(db.Model):
 
 class ApiUsage(db.Model):
     __tablename__ = 'api_usage'
+    __table_args__ = (
+        db.Index('ix_api_usage_user_id_created_at', 'user_id', db.desc('created_at')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -295,6 +425,10 @@ class ApiUsage(db.Model):
 class BatchProcess(db.Model):
     """Model for tracking batches of documents processed together"""
     __tablename__ = 'batch_processes'
+    __table_args__ = (
+        # Dashboard, batches list (paged by created_at, id)
+        db.Index('ix_batch_processes_user_id_created_at_id', 'user_id', db.desc('created_at'), db.desc('id')),
+    )
 
     id = db.Column(db.String(36), primary_key=True)  # UUID as string
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -305,6 +439,7 @@ class BatchProcess(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, processing, completed
     output_filename = db.Column(db.String(255), nullable=True)  # For combined output (zip file)
     create_combined_output = db.Column(db.Boolean, default=True)  # Whether to create a combined output
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every status change
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -313,5 +448,31 @@ class BatchProcess(db.Model):
                                primaryjoin="Document.batch_id == BatchProcess.id")
     user = db.relationship('User', backref='batch_processes', lazy=True)
 
+    @property
+    def etag(self):
+        """Entity tag for the batch status, changes whenever the batch or one of its documents does"""
+        return f"batch-{self.version or 0}"
+
+    @staticmethod
+    def bump_version(batch_id):
+        """Mark a batch as changed in the current transaction, without loading it"""
+        BatchProcess.query.filter_by(id=batch_id).update(
+            {BatchProcess.version: BatchProcess.version + 1},
+            synchronize_session=False
+        )
+
+    @staticmethod
+    def start_processing(batch_id):
+        """
+        Move a pending batch to processing with a compare-and-set on its status
+
+        Returns:
+            bool: True if this call made the transition; the caller commits
+        """
+        return BatchProcess.query.filter_by(id=batch_id, status='pending').update(
+            {BatchProcess.status: 'processing', BatchProcess.version: BatchProcess.version + 1},
+            synchronize_session=False
+        ) == 1
+
     def __repr__(self):
         return f'<BatchProcess {self.id}>'
\ No newline at end of file
@@ -3,52 +3,65 @@ Main routes for the DocGen application with support for multiple image uploads.
 """
 import json
 import os
+import time
 import uuid
-import zipfile
 from datetime import datetime
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, \
-    send_from_directory
+    Response
 from flask_login import login_required, current_user
+from sqlalchemy.orm import load_only, undefer
 from werkzeug.utils import secure_filename
-from PIL import Image
-import time
-import io
 
 from app import db
-from app.models import User, Document, ApiUsage, BatchProcess
-from app.services.document_service import generate_document_from_vision
+from app.models import Document, BatchProcess
+from app.services import events
+from app.services.archive_service import batch_archive_entries, stream_zip
+from app.services.download_service import send_output_file
+from app.services.image_probe import probe_image, count_tiff_pages
+from app.services.job_queue import enqueue
+from app.services.pagination import keyset_paginate
 
 main_bp = Blueprint('main', __name__)
 
+# Columns the document list pages render; heavier columns are left unloaded
+DOCUMENT_LIST_COLUMNS = (Document.id, Document.original_filename, Document.output_filename, Document.file_type,
+                         Document.file_size, Document.status, Document.anthropic_request_id,
+                         Document.created_at, Document.batch_id, Document.batch_order)
+
+# Rows per page on the documents and batches lists
+LIST_PAGE_SIZE = 10
+
 
 def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 
-def validate_image_size(file_path, max_width, max_height):
+def validate_image(file_path, max_pixels, max_pages):
     """
-    Validates image dimensions against maximum limits
+    Validates an image from its header, without decoding it
 
     Args:
         file_path (str): Path to the image file
-        max_width (int): Maximum allowed width
-        max_height (int): Maximum allowed height
+        max_pixels (int): Maximum allowed width x height
+        max_pages (int): Maximum number of pages in a multi-page TIFF
 
     Returns:
-        tuple: (is_valid, error_message)
+        tuple: (is_valid, error_message, image_info)
     """
     try:
-        with Image.open(file_path) as img:
-            width, height = img.size
-            # Basic validation - ensure image isn't too small or too large
-            if width < 100 or height < 100:
-                return False, "Image is too small. Minimum dimensions are 100x100 pixels."
-            if width > max_width or height > max_height:
-                return False, f"Image is too large. Maximum dimensions are {max_width}x{max_height} pixels."
-            return True, None
-    except Exception as e:
-        return False, f"Invalid image: {str(e)}"
+        info = probe_image(file_path)
+        if info.format == 'tiff' and info.multi_frame and count_tiff_pages(file_path, max_pages) > max_pages:
+            return False, f"Document has too many pages. Maximum is {max_pages} pages.", info
+    except ValueError as e:
+        return False, f"Invalid image: {str(e)}", None
+
+    # Basic validation - ensure image isn't too small or too large
+    if info.width < 100 or info.height < 100:
+        return False, "Image is too small. Minimum dimensions are 100x100 pixels.", info
+    if info.pixels > max_pixels:
+        return False, f"Image is too large. Maximum resolution is {max_pixels / 1000000:.1f} megapixels.", info
+    return True, None, info
 
 
 @main_bp.route('/')
@@ -91,7 +104,9 @@ def contact():
 @login_required
 def dashboard():
     # Get user's documents
-    documents = Document.query.filter_by(user_id=current_user.id).order_by(Document.created_at.desc()).limit(10).all()
+    documents = Document.query.options(load_only(*DOCUMENT_LIST_COLUMNS)).filter_by(
+        user_id=current_user.id
+    ).order_by(Document.created_at.desc()).limit(10).all()
 
     # Get user's batch processes
     batches = BatchProcess.query.filter_by(user_id=current_user.id).order_by(BatchProcess.created_at.desc()).limit(
@@ -108,8 +123,7 @@ def dashboard():
                            documents=documents,
                            batches=batches,
                            subscription_status=subscription_status,
-                           remaining_attempts=remaining_attempts,
-                           BatchProcess=BatchProcess)  # Pass the model class for template queries
+                           remaining_attempts=remaining_attempts)
 
 
 @main_bp.route('/upload', methods=['GET', 'POST'])
@@ -122,6 +136,10 @@ def upload():
             flash(message, 'warning')
             return redirect(url_for('payment.plans'))
 
+        # Uploads are streamed to disk as the form is parsed; files over the plan's limit are cut off
+        max_file_size = current_user.get_max_file_size()
+        request.max_file_size = max_file_size
+
         # Look for multiple images in the request with index pattern: image_0, image_1, etc.
         image_files = request.files.getlist('images')  # This gets all files under the name 'images'
 
@@ -156,10 +174,10 @@ def upload():
         # Get language from form
         language = request.form.get('language', 'en')
 
-        # Determine max file size and dimensions based on user plan
-        max_file_size = 20 * 1024 * 1024 if current_user.is_paid_user else 5 * 1024 * 1024  # 20MB or 5MB
-        max_width = 6200 if current_user.is_paid_user else 2048
-        max_height = 6200 if current_user.is_paid_user else 2048
+        # Determine the pixel ceiling based on user plan
+        max_resolution = current_app.config['PAID_USER_MAX_RESOLUTION' if current_user.is_paid_user
+                                            else 'FREE_USER_MAX_RESOLUTION']
+        max_pixels = max_resolution * max_resolution
 
         # Create a batch process record if multiple images
         is_batch = len(image_files) > 1
@@ -167,6 +185,7 @@ def upload():
 
         valid_documents = []
         invalid_files = []
+        multi_frame_files = []
 
         for i, file in enumerate(image_files):
             # Basic validation
@@ -174,32 +193,37 @@ def upload():
                 invalid_files.append((file.filename, 'Invalid file type'))
                 continue
 
-            # Check file size
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)
-
-            if file_size > max_file_size:
-                invalid_files.append((file.filename, f'File too large. Maximum size is {max_file_size / 1024 / 1024:.1f} MB'))
+            # Size limit and file header were checked while the file was received
+            upload = file.stream
+            error_message = upload.check()
+            if error_message:
+                invalid_files.append((file.filename, error_message))
                 continue
 
+            # Validate image dimensions from the header; nothing is decoded here.
+            # PDF pages are rendered by Vision, and their count is checked during OCR.
+            if upload.image_format != 'pdf':
+                is_valid, error_message, image_info = validate_image(
+                    upload.path, max_pixels, current_app.config['MAX_DOCUMENT_PAGES'])
+                if not is_valid:
+                    invalid_files.append((file.filename, error_message))
+                    continue
+                # Multi-page TIFFs are OCR'd page by page; animations only use their first frame
+                if image_info.multi_frame and image_info.format != 'tiff':
+                    multi_frame_files.append(file.filename)
+
+            file_size = upload.size
+            # Hashed while streaming so workers can reuse OCR results for duplicate uploads
+            content_hash = upload.hexdigest()
+
             # Create a unique filename
             original_filename = secure_filename(file.filename)
             file_extension = original_filename.rsplit('.', 1)[1].lower()
             unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
 
-            # Save the file
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            os.makedirs(upload_folder, exist_ok=True)
-            file_path = os.path.join(upload_folder, unique_filename)
-            file.save(file_path)
-
-            # Validate image dimensions
-            is_valid, error_message = validate_image_size(file_path, max_width, max_height)
-            if not is_valid:
-                os.remove(file_path)  # Clean up
-                invalid_files.append((file.filename, error_message))
-                continue
+            # Move the spooled file into place
+            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+            upload.keep(file_path)
 
             # Create document record
             document = Document(
@@ -210,6 +234,7 @@ def upload():
                 language=language,
                 ocr_provider='google_vision',
                 file_size=file_size,
+                content_hash=content_hash,
                 status='pending',
                 batch_id=batch_id,
                 batch_order=i if is_batch else None
@@ -236,18 +261,36 @@ def upload():
             )
             db.session.add(batch_process)
 
+        # Reserve quota for every document in the same transaction that creates them
+        reserved, message = current_user.reserve_usage(len(valid_documents))
+        if not reserved:
+            stored_files = [document.stored_filename for document in valid_documents]
+            db.session.rollback()
+            for stored_filename in stored_files:
+                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], stored_filename)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            flash(message, 'warning')
+            return redirect(url_for('payment.plans'))
+
         # Commit to database
         db.session.commit()
 
-        # Increment usage count for each valid document
-        for _ in valid_documents:
-            current_user.increment_usage()
+        # Hand the documents off to the background workers
+        if is_batch:
+            enqueue('process_batch', batch_id=batch_id)
+        else:
+            enqueue('process_document', document_id=valid_documents[0].id)
 
         # Show warnings for invalid files
         if invalid_files:
             invalid_message = "Some files were skipped: " + ", ".join([f"{name} ({reason})" for name, reason in invalid_files])
             flash(invalid_message, 'warning')
 
+        # Animated files are converted from their first frame only
+        if multi_frame_files:
+            flash("Only the first frame was used for: " + ", ".join(multi_frame_files), 'info')
+
         # Redirect to the appropriate processing page
         if is_batch:
             return redirect(url_for('main.process_batch', batch_id=batch_id))
@@ -259,61 +302,10 @@ def upload():
 
     return render_template('main/upload.html',
                            remaining_attempts=remaining_attempts,
-                           max_file_size_mb=20 if current_user.is_paid_user else 5,
-                           max_width=6200 if current_user.is_paid_user else 2048,
-                           max_height=6200 if current_user.is_paid_user else 2048,
+                           max_file_size_mb=current_user.get_max_file_size() // (1024 * 1024),
+                           max_resolution=current_app.config['PAID_USER_MAX_RESOLUTION' if current_user.is_paid_user
+                                                             else 'FREE_USER_MAX_RESOLUTION'],
                            allowed_extensions=current_app.config['ALLOWED_EXTENSIONS'])
-def create_batch_zip(batch_id):
-    """
-    Create a zip file containing all completed documents in a batch
-
-    Args:
-        batch_id (str): The batch ID
-
-    Returns:
-        str: Path to the created zip file
-    """
-    batch = BatchProcess.query.get(batch_id)
-    if not batch or batch.completed_documents == 0:
-        return None
-
-    # Get all completed documents in the batch
-    documents = Document.query.filter_by(
-        batch_id=batch_id,
-        status='completed'
-    ).order_by(Document.batch_order).all()
-
-    # Create zip filename
-    zip_filename = f"batch_{batch_id}.zip"
-    zip_path = os.path.join(current_app.config['UPLOAD_FOLDER'], zip_filename)
-
-    # Create zip file
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for doc in documents:
-            # Get the document file path
-            doc_path = os.path.join(current_app.config['UPLOAD_FOLDER'], doc.output_filename)
-
-            # Create a filename for the document in the zip
-            if len(documents) > 1:
-                # Use original filename with index for multiple files
-                base_name = os.path.splitext(doc.original_filename)[0]
-                ext = doc.file_type
-                zip_filename = f"{base_name}_{doc.batch_order + 1}.{ext}"
-            else:
-                # Use original filename for single file
-                base_name = os.path.splitext(doc.original_filename)[0]
-                ext = doc.file_type
-                zip_filename = f"{base_name}.{ext}"
-
-            # Add file to zip
-            if os.path.exists(doc_path):
-                zipf.write(doc_path, zip_filename)
-
-    # Update batch with zip file info
-    batch.output_filename = zip_filename
-    db.session.commit()
-
-    return zip_path
 
 
 @main_bp.route('/process/<int:document_id>')
@@ -327,104 +319,29 @@ def process_document(document_id):
         flash('Unauthorized access', 'danger')
         return redirect(url_for('main.dashboard'))
 
-    # If document is already processed or failed, show the result
-    if document.status in ['completed', 'failed']:
-        return render_template('main/result.html', document=document)
-
-    # Update status to processing
-    if document.status == 'pending':
-        document.status = 'processing'
-        db.session.commit()
-
-        try:
-            # Get the file path
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], document.stored_filename)
-
-            # Process with Google Vision API for OCR
-            start_time = time.time()
+    # Batch documents are tracked on the batch progress page
+    if document.batch_id and document.status not in ['completed', 'failed']:
+        return redirect(url_for('main.process_batch', batch_id=document.batch_id))
 
-            # Import here to avoid import errors if Google Vision isn't installed
-            from app.services.google_vision_service import detect_text_with_vision
+    # Processing happens in a background worker; the result page polls document_status
+    return render_template('main/result.html', document=document)
 
-            ocr_text, structured_data, request_id = detect_text_with_vision(
-                file_path,
-                language_hint=document.language
-            )
 
-            # Store structured data as JSON
-            document.structured_data = json.dumps(structured_data)
-            document.anthropic_request_id = request_id  # Kept for compatibility
-
-            processing_time = time.time() - start_time
-
-            # Generate the output document
-            output_filename = f"{uuid.uuid4().hex}.{document.file_type}"
-            output_path = os.path.join(current_app.config['UPLOAD_FOLDER'], output_filename)
-
-            # Parse structured data if available
-            structured_data_obj = None
-            if document.structured_data:
-                try:
-                    structured_data_obj = json.loads(document.structured_data)
-                except:
-                    current_app.logger.warning(f"Failed to parse structured data for document {document.id}")
-
-            # Use the new direct document generation function that doesn't require Anthropic
-            success, error_message = generate_document_from_vision(
-                structured_data_obj,
-                ocr_text,  # Also pass the OCR text as a fallback
-                document.file_type,
-                output_path
-            )
+@main_bp.route('/document/status/<int:document_id>')
+@login_required
+def document_status(document_id):
+    """AJAX endpoint to get document processing status"""
+    document = Document.query.get_or_404(document_id)
 
-            if success:
-                document.status = 'completed'
-                document.output_filename = output_filename
-            else:
-                document.status = 'failed'
-                document.error_message = error_message
+    # Security check - ensure the document belongs to the current user
+    if document.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized access'}), 403
 
-            # Record API usage
-            api_usage = ApiUsage(
-                user_id=current_user.id,
-                document_id=document.id,
-                api_type='google_vision',  # Changed from 'anthropic'
-                processing_time=processing_time
-            )
-            db.session.add(api_usage)
-
-            # Update batch process if part of a batch
-            if document.batch_id:
-                batch = BatchProcess.query.get(document.batch_id)
-                if batch:
-                    if document.status == 'completed':
-                        batch.completed_documents += 1
-                    elif document.status == 'failed':
-                        batch.failed_documents += 1
-
-                    # Update batch status if all documents are processed
-                    if batch.completed_documents + batch.failed_documents >= batch.total_documents:
-                        batch.status = 'completed'
-
-                        # Create a zip file if there are completed documents and we need to output all docs as one
-                        if batch.completed_documents > 0 and batch.create_combined_output:
-                            try:
-                                create_batch_zip(batch.id)
-                            except Exception as e:
-                                current_app.logger.error(f"Error creating batch zip: {str(e)}")
-
-            db.session.commit()
-
-        except Exception as e:
-            document.status = 'failed'
-            document.error_message = str(e)
-            db.session.commit()
-
-    # At the end of your process_document function
-    if document.batch_id:
-        return redirect(url_for('main.process_batch', batch_id=document.batch_id))
-    else:
-        return render_template('main/result.html', document=document)
+    return jsonify({
+        'id': document.id,
+        'status': document.status,
+        'has_output': bool(document.output_filename)
+    })
 
 
 @main_bp.route('/download/<int:document_id>')
@@ -451,40 +368,78 @@ def download_document(document_id):
     download_filename = f"processed_{document.original_filename.rsplit('.', 1)[0]}.{document.file_type}"
 
     # Send the file
-    return send_from_directory(
-        directory=current_app.config['UPLOAD_FOLDER'],
-        path=document.output_filename,
-        download_name=download_filename,
-        mimetype=content_type,
-        as_attachment=True
-    )
+    return send_output_file(document.output_filename, download_filename, content_type)
+
+
+def document_list_page(after=None, before=None):
+    """Get one page of the current user's documents, newest first"""
+    query = Document.query.options(load_only(*DOCUMENT_LIST_COLUMNS)).filter_by(user_id=current_user.id)
+    return keyset_paginate(query, Document, after=after, before=before, per_page=LIST_PAGE_SIZE)
+
+
+def batch_list_page(after=None, before=None):
+    """Get one page of the current user's batches, newest first"""
+    query = BatchProcess.query.filter_by(user_id=current_user.id)
+    return keyset_paginate(query, BatchProcess, after=after, before=before, per_page=LIST_PAGE_SIZE)
 
 
 @main_bp.route('/documents')
 @login_required
 def documents():
-    # Get all user's documents with pagination
-    page = request.args.get('page', 1, type=int)
+    # Pages are addressed by cursor: ?after= for older rows, ?before= for newer ones
+    after = request.args.get('after')
+    before = request.args.get('before')
 
     # Option to view only batches
     show_batches = request.args.get('show_batches', 'false').lower() == 'true'
 
     if show_batches:
         # Show batch processes
-        batches = BatchProcess.query.filter_by(user_id=current_user.id).order_by(
-            BatchProcess.created_at.desc()
-        ).paginate(page=page, per_page=10)
-
+        batches = batch_list_page(after, before)
         return render_template('main/batches.html', batches=batches)
     else:
         # Normal document view
-        documents = Document.query.filter_by(user_id=current_user.id).order_by(
-            Document.created_at.desc()
-        ).paginate(page=page, per_page=10)
-
+        documents = document_list_page(after, before)
         return render_template('main/documents.html', documents=documents)
 
 
+@main_bp.route('/documents/feed')
+@login_required
+def documents_feed():
+    """AJAX endpoint for infinite scrolling: the next page of documents or batches after a cursor"""
+    after = request.args.get('after')
+    if request.args.get('show_batches', 'false').lower() == 'true':
+        page = batch_list_page(after)
+        items = [{
+            'id': batch.id,
+            'total_documents': batch.total_documents,
+            'completed_documents': batch.completed_documents,
+            'failed_documents': batch.failed_documents,
+            'output_format': batch.output_format,
+            'status': batch.status,
+            'created_at': batch.created_at.isoformat(),
+            'url': url_for('main.process_batch', batch_id=batch.id)
+        } for batch in page.items]
+    else:
+        page = document_list_page(after)
+        items = [{
+            'id': document.id,
+            'original_filename': document.original_filename,
+            'file_type': document.file_type,
+            'file_size': document.file_size,
+            'status': document.status,
+            'batch_id': document.batch_id,
+            'created_at': document.created_at.isoformat(),
+            'url': url_for('main.process_document', document_id=document.id)
+        } for document in page.items]
+
+    return jsonify({
+        'items': items,
+        'has_next': page.has_next,
+        'next_cursor': page.next_cursor
+    })
+
+
 @main_bp.route('/process/batch/<string:batch_id>')
 @login_required
 def process_batch(batch_id):
@@ -496,8 +451,10 @@ def process_batch(batch_id):
         flash('Unauthorized access', 'danger')
         return redirect(url_for('main.dashboard'))
 
-    # Get all documents in the batch
-    documents = Document.query.filter_by(batch_id=batch_id).order_by(Document.batch_order).all()
+    # Get all documents in the batch (error messages are shown inline for failed ones)
+    documents = Document.query.options(
+        load_only(*DOCUMENT_LIST_COLUMNS), undefer(Document.error_message)
+    ).filter_by(batch_id=batch_id).order_by(Document.batch_order).all()
 
     # If no documents found
     if not documents:
@@ -508,17 +465,10 @@ def process_batch(batch_id):
     if batch.status == 'completed':
         return render_template('main/batch_result.html', batch=batch, documents=documents)
 
-    # For pending batches, start processing the documents
-    if batch.status == 'pending' or batch.status == 'processing':
-        batch.status = 'processing'
+    # Documents are processed by background workers; the page polls batch_status
+    if batch.status == 'pending' and BatchProcess.start_processing(batch_id):
         db.session.commit()
 
-        # Process the first pending document we find
-        for document in documents:
-            if document.status == 'pending':
-                # Redirect to process this particular document
-                return redirect(url_for('main.process_document', document_id=document.id))
-
     # Return batch progress page
     return render_template('main/batch_result.html', batch=batch, documents=documents)
 
@@ -540,31 +490,31 @@ def download_batch(batch_id):
         flash('Batch processing is not complete yet', 'warning')
         return redirect(url_for('main.process_batch', batch_id=batch_id))
 
-    # If we don't have a zip file yet, create one
-    if not batch.output_filename:
-        try:
-            create_batch_zip(batch_id)
-        except Exception as e:
-            flash(f'Error creating batch file: {str(e)}', 'danger')
-            return redirect(url_for('main.process_batch', batch_id=batch_id))
+    # Generate a friendly filename
+    download_filename = f"DocGen_Batch_{datetime.now().strftime('%Y%m%d')}.zip"
+
+    # Send the archive built while the batch was processed, if there is one
+    if batch.output_filename and os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'],
+                                                             batch.output_filename)):
+        return send_output_file(batch.output_filename, download_filename, 'application/zip')
+
+    # Otherwise get the completed documents, in batch order
+    documents = Document.query.options(
+        load_only(Document.original_filename, Document.output_filename, Document.file_type, Document.batch_order)
+    ).filter_by(
+        batch_id=batch_id,
+        status='completed'
+    ).order_by(Document.batch_order).all()
 
-    # Check if zip file exists
-    zip_path = os.path.join(current_app.config['UPLOAD_FOLDER'], batch.output_filename)
-    if not os.path.exists(zip_path):
+    entries = batch_archive_entries(documents, current_app.config['UPLOAD_FOLDER'], batch.total_documents > 1)
+    if not entries:
         flash('Batch file not found', 'danger')
         return redirect(url_for('main.process_batch', batch_id=batch_id))
 
-    # Generate a friendly filename
-    download_filename = f"DocGen_Batch_{datetime.now().strftime('%Y%m%d')}.zip"
-
-    # Send the zip file
-    return send_from_directory(
-        directory=current_app.config['UPLOAD_FOLDER'],
-        path=batch.output_filename,
-        download_name=download_filename,
-        mimetype='application/zip',
-        as_attachment=True
-    )
+    # Stream the zip as it is built, without writing it to disk first
+    response = Response(stream_zip(entries), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_filename}"'
+    return response
 
 
 @main_bp.route('/batch/status/<string:batch_id>')
@@ -578,21 +528,89 @@ def batch_status(batch_id):
     if batch.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized access'}), 403
 
-    # Get all documents in the batch
-    documents = Document.query.filter_by(batch_id=batch_id).order_by(Document.batch_order).all()
+    # The version stamp changes with every status change, so a matching poll needs no document query
+    if request.if_none_match.contains(batch.etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(batch_status_data(batch))
+
+    response.set_etag(batch.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@main_bp.route('/batch/events/<string:batch_id>')
+@login_required
+def batch_events(batch_id):
+    """Server-Sent Events stream of batch and document status changes"""
+    batch = BatchProcess.query.get_or_404(batch_id)
+
+    # Security check - ensure the batch belongs to the current user
+    if batch.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized access'}), 403
+
+    # Subscribe before taking the snapshot so no change falls between the two
+    subscription = events.subscribe(events.batch_channel(batch_id))
+    snapshot = batch_status_data(batch)
+
+    heartbeat = current_app.config.get('SSE_HEARTBEAT_INTERVAL', 15)
+    max_duration = current_app.config.get('SSE_MAX_DURATION', 300)
+
+    def stream():
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+            if snapshot['status'] == 'completed':
+                return
+
+            deadline = time.monotonic() + max_duration
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    # Comment line, keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event['type'] == 'batch' and event['status'] == 'completed':
+                    return
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+    })
+
+
+def batch_status_data(batch):
+    """
+    Get the status of a batch and each of its documents
+
+    Args:
+        batch (BatchProcess): The batch
+
+    Returns:
+        dict: Batch counters and per-document statuses
+    """
+    # Get the status columns only; error messages are fetched for failed documents alone
+    documents = db.session.query(
+        Document.id,
+        Document.original_filename,
+        Document.status,
+        db.case((Document.status == 'failed', Document.error_message), else_=None)
+    ).filter_by(batch_id=batch.id).order_by(Document.batch_order).all()
 
     # Prepare status data
     doc_statuses = []
-    for doc in documents:
+    for doc_id, filename, status, error_message in documents:
         doc_statuses.append({
-            'id': doc.id,
-            'filename': doc.original_filename,
-            'status': doc.status,
-            'error_message': doc.error_message if doc.status == 'failed' else None
+            'id': doc_id,
+            'filename': filename,
+            'status': status,
+            'error_message': error_message
         })
 
-    # Return batch status
-    return jsonify({
+    return {
         'id': batch.id,
         'status': batch.status,
         'total': batch.total_documents,
@@ -600,4 +618,4 @@ def batch_status(batch_id):
         'failed': batch.failed_documents,
         'documents': doc_statuses,
         'has_output': bool(batch.output_filename)
-    })
\ No newline at end of file
+    }
\ No newline at end of file
@@ -6,6 +6,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import User, Payment, Plan
 from app.services import razorpay_service
+from app.services.plan_cache import get_plan
 
 payment_bp = Blueprint('payment', __name__, url_prefix='/payment')
 
@@ -238,10 +239,10 @@ def plans():
     currency = 'INR' if is_india else 'USD'
 
     # Get plans from database
-    free_plan = Plan.query.filter_by(name='free').first()
-    monthly_plan = Plan.query.filter_by(name='monthly').first()
-    yearly_plan = Plan.query.filter_by(name='yearly').first()
-    enterprise_plan = Plan.query.filter_by(name='enterprise').first()
+    free_plan = get_plan('free')
+    monthly_plan = get_plan('monthly')
+    yearly_plan = get_plan('yearly')
+    enterprise_plan = get_plan('enterprise')
 
     # Get current user subscription
     user_plan = None
@@ -265,9 +266,8 @@ def plans():
 @login_required
 def checkout(plan_type):
     """Create a checkout session for the specified plan"""
-    # Get plan from database
-    from app.models import Plan
-    plan = Plan.query.filter_by(name=plan_type, is_active=True).first()
+    # Get plan from the plan cache
+    plan = get_plan(plan_type, active_only=True)
 
     if not plan:
         flash('Invalid plan type or plan is not available', 'danger')
@@ -0,0 +1,242 @@
+"""
+Archive Service - Builds batch zip archives
+
+Batch archives are built incrementally: each output file is appended to a
+`.part` file (local header and data) as soon as its document completes, and
+finalizing the batch only writes the central directory. When no finished
+archive is available, stream_zip builds one on the fly while it is sent.
+"""
+import os
+import shutil
+import struct
+import time
+import zipfile
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; appends are then unlocked
+    fcntl = None
+
+# Formats that are already compressed; deflating them again costs CPU for no gain
+STORED_EXTENSIONS = {'docx', 'xlsx', 'pdf', 'zip', 'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+
+def batch_archive_name(document, multiple):
+    """
+    Get the name of a document's output file inside its batch archive
+
+    Args:
+        document (Document): A completed document
+        multiple (bool): Whether the batch has more than one document
+
+    Returns:
+        str: The archive name
+    """
+    base_name = os.path.splitext(document.original_filename)[0]
+    if multiple:
+        # Use original filename with index for multiple files
+        return f"{base_name}_{document.batch_order + 1}.{document.file_type}"
+    return f"{base_name}.{document.file_type}"
+
+
+def _compress_type(arcname):
+    extension = arcname.rsplit('.', 1)[-1].lower()
+    return zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def batch_archive_entries(documents, folder, multiple):
+    """
+    Get the files of a batch and the names they get inside its archive
+
+    Args:
+        documents (list): Completed documents with original_filename, output_filename,
+            file_type and batch_order, in batch order
+        folder (str): Directory holding the output files
+        multiple (bool): Whether the batch has more than one document (total_documents > 1),
+            so the names match those given by the incrementally built archive
+
+    Returns:
+        list: (file path, archive name) tuples for the files that exist
+    """
+    entries = []
+    for doc in documents:
+        path = os.path.join(folder, doc.output_filename)
+        if os.path.exists(path):
+            entries.append((path, batch_archive_name(doc, multiple)))
+    return entries
+
+
+class _StreamSink:
+    """Write-only file object that collects zip output until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries, chunk_size=64 * 1024):
+    """
+    Generate a zip archive piece by piece
+
+    Args:
+        entries (list): (file path, archive name) tuples
+        chunk_size (int): Bytes read from each file at a time
+
+    Yields:
+        bytes: Consecutive parts of the archive
+    """
+    sink = _StreamSink()
+
+    # The sink can't seek, so zipfile writes sizes and CRCs after each entry's data
+    with zipfile.ZipFile(sink, 'w') as archive:
+        for path, arcname in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = _compress_type(arcname)
+
+            with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+            yield sink.drain()
+
+    # Central directory
+    yield sink.drain()
+
+
+def append_to_archive(part_path, path, arcname, chunk_size=64 * 1024):
+    """
+    Append one file to an unfinished archive
+
+    Only the entry's local header and data are written; finalize_archive adds
+    the central directory. Appends from several threads or processes are
+    serialized with a file lock.
+
+    Args:
+        part_path (str): Path of the unfinished archive, created if missing
+        path (str): File to add
+        arcname (str): Name of the file inside the archive
+        chunk_size (int): Bytes read at a time
+    """
+    info = zipfile.ZipInfo(arcname, date_time=time.localtime(os.path.getmtime(path))[:6])
+    info.compress_type = _compress_type(arcname)
+    info.external_attr = 0o644 << 16
+
+    # Read the file once up front so the local header can carry the final sizes and CRC.
+    # Deflated data is kept for the write; stored files are copied again from disk.
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) \
+        if info.compress_type == zipfile.ZIP_DEFLATED else None
+    crc, file_size, compressed = 0, 0, []
+    with open(path, 'rb') as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            if compressor:
+                compressed.append(compressor.compress(chunk))
+    if compressor:
+        compressed.append(compressor.flush())
+
+    info.CRC = crc
+    info.file_size = file_size
+    info.compress_size = sum(len(part) for part in compressed) if compressor else file_size
+
+    with open(part_path, 'ab') as archive:
+        if fcntl:
+            fcntl.flock(archive, fcntl.LOCK_EX)
+        try:
+            archive.write(info.FileHeader(zip64=False))
+            if compressor:
+                for part in compressed:
+                    archive.write(part)
+            else:
+                with open(path, 'rb') as source:
+                    shutil.copyfileobj(source, archive, chunk_size)
+            archive.flush()
+            os.fsync(archive.fileno())
+        finally:
+            if fcntl:
+                fcntl.flock(archive, fcntl.LOCK_UN)
+
+
+def finalize_archive(part_path, archive_path):
+    """
+    Finish an archive built with append_to_archive
+
+    Reads back the local headers, writes the central directory after them and
+    moves the result to archive_path. A torn entry at the end (from a crash
+    during an append) is dropped.
+
+    Args:
+        part_path (str): Path of the unfinished archive
+        archive_path (str): Where to put the finished archive
+
+    Returns:
+        int: Number of entries in the archive
+    """
+    with open(part_path, 'r+b') as archive:
+        if fcntl:
+            fcntl.flock(archive, fcntl.LOCK_EX)
+
+        central_directory = []
+        end = os.fstat(archive.fileno()).st_size
+        offset = 0
+        while offset + zipfile.sizeFileHeader <= end:
+            archive.seek(offset)
+            header = struct.unpack(zipfile.structFileHeader, archive.read(zipfile.sizeFileHeader))
+            if header[0] != zipfile.stringFileHeader:
+                break
+            (_, extract_version, _, flag_bits, compress_type, mod_time, mod_date,
+             crc, compress_size, file_size, name_length, extra_length) = header
+            name = archive.read(name_length)
+            entry_end = offset + zipfile.sizeFileHeader + name_length + extra_length + compress_size
+            if entry_end > end:
+                break
+
+            central_directory.append(struct.pack(
+                zipfile.structCentralDir, zipfile.stringCentralDir, 20, 3, extract_version, 0,
+                flag_bits, compress_type, mod_time, mod_date, crc, compress_size, file_size,
+                name_length, 0, 0, 0, 0, 0o644 << 16, offset
+            ) + name)
+            offset = entry_end
+
+        if offset > 0xFFFFFFFF or len(central_directory) > 0xFFFF:
+            raise ValueError('Batch archive is too large for a zip without ZIP64 records')
+
+        directory = b''.join(central_directory)
+        archive.seek(offset)
+        archive.truncate()
+        archive.write(directory)
+        archive.write(struct.pack(
+            zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0,
+            len(central_directory), len(central_directory), len(directory), offset, 0
+        ))
+        archive.flush()
+        os.fsync(archive.fileno())
+
+    os.replace(part_path, archive_path)
+    return len(central_directory)
@@ -0,0 +1,199 @@
+"""
+Cache Service - Size-bounded, content-addressed disk caches
+
+Entries are plain files named by a hash of their key, so every web and job
+worker process on a host shares the same cache. Each entry's mtime records
+when it was written (for the TTL) and its atime records when it was last
+used (for LRU eviction once the cache grows past its size limit).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from app.services import metrics
+
+# Caches keyed by directory, so each directory is managed by one instance per process
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class DiskCache:
+    """LRU + TTL cache of byte strings or files stored under one directory"""
+
+    def __init__(self, name, directory, max_bytes, ttl=None):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Approximate size of the cache, refreshed whenever we evict
+        self._size = self._scan_size()
+
+        self.hits = metrics.counter(f"{name}_cache_hits")
+        self.misses = metrics.counter(f"{name}_cache_misses")
+        self.evictions = metrics.counter(f"{name}_cache_evictions")
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a cache key from several parts"""
+        return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _scan_size(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    pass
+        return total
+
+    def get_path(self, key):
+        """
+        Look up an entry and return the path of its file
+
+        Args:
+            key (str): Cache key from make_key
+
+        Returns:
+            str: Path to the cached file, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.misses.inc()
+            return None
+
+        now = time.time()
+        if self.ttl and stat.st_mtime + self.ttl < now:
+            self._remove(path)
+            self.misses.inc()
+            return None
+
+        # Record the access for LRU ordering without touching the write time
+        try:
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+
+        self.hits.inc()
+        return path
+
+    def get(self, key):
+        """Return the cached bytes for a key, or None on a miss"""
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, data):
+        """Store bytes under a key"""
+        self._write(key, lambda f: f.write(data))
+
+    def set_file(self, key, source_path):
+        """Store a copy of an existing file under a key"""
+        def copy(f):
+            with open(source_path, 'rb') as source:
+                shutil.copyfileobj(source, f)
+        self._write(key, copy)
+
+    def _write(self, key, writer):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer(f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._size += size
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._size -= size
+        self.evictions.inc()
+
+    def evict(self):
+        """Remove expired entries, then least recently used ones until the cache fits its size limit"""
+        now = time.time()
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_mtime, stat.st_size, path))
+
+        total = sum(entry[2] for entry in entries)
+        evicted = 0
+        # Oldest access first
+        for atime, mtime, size, path in sorted(entries):
+            expired = self.ttl and mtime + self.ttl < now
+            if not expired and total <= self.max_bytes:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self._size = total
+        if evicted:
+            self.evictions.inc(evicted)
+
+
+def get_cache(name, directory, max_bytes, ttl=None):
+    """
+    Get the DiskCache for a directory, creating it on first use
+
+    Args:
+        name (str): Metric name prefix, e.g. 'ocr'
+        directory (str): Directory holding the cache entries
+        max_bytes (int): Size limit for the whole cache
+        ttl (int, optional): Maximum age of an entry in seconds
+
+    Returns:
+        DiskCache: The cache
+    """
+    cache = _caches.get(directory)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(directory)
+            if cache is None:
+                cache = _caches[directory] = DiskCache(name, directory, max_bytes, ttl)
+    return cache
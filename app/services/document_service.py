@@ -2,10 +2,75 @@
 Document Service - Generates formatted documents from Google Vision OCR data
 """
 import os
+import shutil
 from flask import current_app
 import json
+import hashlib
 from datetime import datetime
 
+from app.services import metrics
+from app.services.cache_service import get_cache
+
+# Bump whenever the generators change their output so cached renders are not reused
+GENERATOR_VERSION = 2
+
+
+def generate_document_cached(structured_data, ocr_text, output_format, output_path):
+    """
+    Generate a document, reusing an earlier render of the same OCR data and format
+
+    Renders are cached on disk keyed by (structured data hash, output format,
+    GENERATOR_VERSION), so re-requests and identical uploads from other users
+    are served with a file link instead of a fresh render.
+
+    Args:
+        structured_data (dict): Structured data from Google Vision API
+        ocr_text (str): Raw OCR text as fallback if structured data is incomplete
+        output_format (str): The desired output format ('docx', 'pdf', 'xlsx')
+        output_path (str): The path where the output document should be saved
+
+    Returns:
+        tuple: (success, error_message)
+    """
+    config = current_app.config
+    if not config.get('RENDER_CACHE_ENABLED'):
+        return generate_document_from_vision(structured_data, ocr_text, output_format, output_path)
+
+    cache = get_cache('render', config['RENDER_CACHE_DIR'], config['RENDER_CACHE_MAX_BYTES'],
+                      config.get('RENDER_CACHE_TTL'))
+
+    # The OCR text is part of the key because it is the fallback content when structured data is empty
+    content = json.dumps([structured_data, ocr_text], sort_keys=True, separators=(',', ':'))
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    key = cache.make_key(GENERATOR_VERSION, output_format, content_hash)
+
+    cached_path = cache.get_path(key)
+    if cached_path:
+        try:
+            _link_or_copy(cached_path, output_path)
+            return True, None
+        except OSError as e:
+            current_app.logger.warning(f"Could not reuse cached render {key}: {str(e)}")
+
+    with metrics.histogram(f"render_{output_format}_seconds").time():
+        success, error_message = generate_document_from_vision(structured_data, ocr_text, output_format, output_path)
+
+    if success:
+        try:
+            cache.set_file(key, output_path)
+        except OSError as e:
+            current_app.logger.warning(f"Could not cache render {key}: {str(e)}")
+
+    return success, error_message
+
+
+def _link_or_copy(source_path, output_path):
+    """Hard-link a cached file into place, copying when the paths are on different filesystems"""
+    try:
+        os.link(source_path, output_path)
+    except OSError:
+        shutil.copyfile(source_path, output_path)
+
 
 def generate_document_from_vision(structured_data, ocr_text, output_format, output_path):
     """
@@ -33,6 +98,27 @@ def generate_document_from_vision(structured_data, ocr_text, output_format, outp
         return False, f"Error generating document: {str(e)}"
 
 
+def index_tables(structured_data):
+    """
+    Map each detected table to the (page index, block index) it was extracted from
+
+    Args:
+        structured_data (dict): Structured data from Google Vision API
+
+    Returns:
+        dict: Tables keyed by (page, block); the first table wins if a block has several
+    """
+    tables_by_block = {}
+    for table in structured_data.get('tables', []):
+        tables_by_block.setdefault((table.get('page'), table.get('block')), table)
+    return tables_by_block
+
+
+def _block_top(block):
+    """Top edge of a block, used to sort blocks into reading order"""
+    return min(v[1] for v in block.get('bounding_box') or [(0, 0)])
+
+
 def generate_word_document(structured_data, ocr_text, output_path):
     """Generate Word document from structured Vision API data"""
     try:
@@ -48,22 +134,22 @@ def generate_word_document(structured_data, ocr_text, output_path):
             doc.save(output_path)
             return True, None
 
+        tables_by_block = index_tables(structured_data)
+
         # Process each page
-        for page in structured_data.get('pages', []):
+        for page_idx, page in enumerate(structured_data.get('pages', [])):
             # Sort blocks by vertical position (top to bottom)
             blocks = page.get('blocks', [])
             if not blocks:
                 continue
 
-            # Sort blocks by vertical position for proper reading order
-            sorted_blocks = sorted(blocks, key=lambda b: min(v[1] for v in b.get('bounding_box', [(0, 0)])))
+            # Sort blocks by vertical position for proper reading order, keeping their original index
+            sorted_blocks = sorted(enumerate(blocks), key=lambda item: _block_top(item[1]))
 
-            for block in sorted_blocks:
+            for block_idx, block in sorted_blocks:
                 if block.get('type') == 'table':
                     # Create a table in Word
-                    table_data = next((t for t in structured_data.get('tables', [])
-                                       if t.get('page') == structured_data.get('pages').index(page) and
-                                       t.get('block') == blocks.index(block)), None)
+                    table_data = tables_by_block.get((page_idx, block_idx))
 
                     if table_data and table_data.get('rows'):
                         rows = table_data.get('rows', [])
@@ -73,10 +159,12 @@ def generate_word_document(structured_data, ocr_text, output_path):
                             table = doc.add_table(rows=len(rows), cols=max_cols)
                             table.style = 'Table Grid'
 
-                            for i, row in enumerate(rows):
+                            # Fetch each row's cells once; python-docx rebuilds them on every access
+                            for table_row, row in zip(table.rows, rows):
+                                cells = table_row.cells
                                 for j, cell_text in enumerate(row):
-                                    if j < len(table.rows[i].cells):
-                                        table.rows[i].cells[j].text = cell_text
+                                    if j < len(cells):
+                                        cells[j].text = cell_text
 
                             # Add spacing after table
                             doc.add_paragraph()
@@ -194,19 +282,18 @@ def generate_pdf_document(structured_data, ocr_text, output_path):
             doc.build(elements)
             return True, None
 
+        tables_by_block = index_tables(structured_data)
+
         # Process each page
-        for page in structured_data.get('pages', []):
-            # Sort blocks by vertical position
+        for page_idx, page in enumerate(structured_data.get('pages', [])):
+            # Sort blocks by vertical position, keeping their original index
             blocks = page.get('blocks', [])
-            blocks.sort(key=lambda b: min(v[1] for v in b.get('bounding_box', [(0, 0)])))
+            sorted_blocks = sorted(enumerate(blocks), key=lambda item: _block_top(item[1]))
 
-            for block in blocks:
+            for block_idx, block in sorted_blocks:
                 if block.get('type') == 'table':
                     # Create a table in PDF
-                    table_data = next((t for t in structured_data.get('tables', [])
-                                       if t.get('page') == structured_data.get('pages').index(page) and
-                                       t.get('block') == blocks.index(block)),
-                                      None)
+                    table_data = tables_by_block.get((page_idx, block_idx))
 
                     if table_data and table_data.get('rows'):
                         t = Table(table_data.get('rows'))
@@ -0,0 +1,92 @@
+"""
+Download Service - Sends output files to the browser
+
+Files get a strong ETag and support Range requests, so clients can resume
+downloads and skip ones they already have. In production the transfer itself
+can be handed to the web server (nginx X-Accel-Redirect or X-Sendfile), so no
+Python worker is tied up while a large file is sent.
+"""
+import os
+import unicodedata
+from urllib.parse import quote
+
+from flask import current_app, request, send_file, abort
+from werkzeug.security import safe_join
+
+
+def file_etag(stat):
+    """
+    Get the entity tag of a file
+
+    Output files are written once and never modified in place, so the size and
+    modification time identify their content.
+
+    Args:
+        stat (os.stat_result): Result of os.stat() on the file
+
+    Returns:
+        str: The entity tag, without quotes
+    """
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def _filename_params(download_name):
+    """Content-Disposition filename parameters, with an RFC 5987 variant for non-ASCII names"""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+-.^_`|~')}"}
+    return {'filename': download_name}
+
+
+def send_output_file(filename, download_name, mimetype):
+    """
+    Send a file from the upload folder as an attachment
+
+    Args:
+        filename (str): Name of the file inside UPLOAD_FOLDER
+        download_name (str): Filename offered to the browser
+        mimetype (str): Content type of the file
+
+    Returns:
+        Response: The file, a 206 partial response, a 304, or an offload response
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    stat = os.stat(path)
+    offload = current_app.config.get('DOWNLOAD_OFFLOAD')
+
+    if offload in ('nginx', 'sendfile'):
+        # The web server sends the body and handles Range; we only answer revalidation
+        response = current_app.response_class(mimetype=mimetype)
+        if offload == 'nginx':
+            prefix = current_app.config.get('DOWNLOAD_ACCEL_PREFIX', '/protected-downloads/')
+            response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(filename)
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        response.headers.set('Content-Disposition', 'attachment', **_filename_params(download_name))
+        response.set_etag(file_etag(stat))
+        response.last_modified = stat.st_mtime
+        response = response.make_conditional(request)
+    else:
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=file_etag(stat),
+            last_modified=stat.st_mtime
+        )
+
+    # Advertise resumable downloads; both paths above honor Range
+    response.accept_ranges = 'bytes'
+
+    # Outputs belong to one user; browsers may keep them but must revalidate
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
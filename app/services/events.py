@@ -0,0 +1,177 @@
+"""
+Events Service - Pushes document and batch status changes to web clients
+
+Job workers publish status events to the queue backend's event log (see
+job_queue.py). Each web process runs one EventHub thread that tails that log
+and hands every event to the in-process subscribers of its channel, so the
+Server-Sent Events streams never touch the database while they wait.
+"""
+import os
+import queue
+import threading
+import logging
+
+from flask import current_app
+
+from app.services import metrics
+from app.services.job_queue import get_queue
+
+logger = logging.getLogger(__name__)
+
+# One hub per process, started on first subscription
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def batch_channel(batch_id):
+    """Name of the channel that carries a batch's status events"""
+    return f"batch:{batch_id}"
+
+
+def publish(channel, data):
+    """
+    Publish an event to every subscriber of a channel, in any web process
+
+    Publishing is best effort: a failure is logged and never fails the caller.
+
+    Args:
+        channel (str): Channel name, e.g. from batch_channel()
+        data (dict): JSON-serializable event, with a 'type' key
+    """
+    try:
+        get_queue().publish_event(channel, data)
+        metrics.counter('events_published').inc()
+    except Exception as e:
+        current_app.logger.error(f"Error publishing event to {channel}: {str(e)}")
+
+
+def publish_document_status(document):
+    """Publish a document's current status to its batch channel"""
+    if not document.batch_id:
+        return
+    publish(batch_channel(document.batch_id), {
+        'type': 'document',
+        'id': document.id,
+        'status': document.status,
+        'error_message': document.error_message if document.status == 'failed' else None
+    })
+
+
+def publish_batch_status(batch):
+    """Publish a batch's current counters and status"""
+    publish(batch_channel(batch.id), {
+        'type': 'batch',
+        'id': batch.id,
+        'status': batch.status,
+        'total': batch.total_documents,
+        'completed': batch.completed_documents,
+        'failed': batch.failed_documents,
+        'has_output': bool(batch.output_filename)
+    })
+
+
+class Subscription:
+    """Events for one channel, buffered for one client"""
+
+    def __init__(self, hub, channel, max_events=1000):
+        self.hub = hub
+        self.channel = channel
+        self._events = queue.Queue(maxsize=max_events)
+
+    def put(self, data):
+        try:
+            self._events.put_nowait(data)
+        except queue.Full:
+            # A stalled client only loses its own events
+            metrics.counter('events_dropped').inc()
+
+    def get(self, timeout=None):
+        """Return the next event, or None if none arrives within timeout"""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """Tails the event log on a background thread and fans events out to subscribers"""
+
+    def __init__(self, event_queue, poll_interval=0.5):
+        self.event_queue = event_queue
+        self.poll_interval = poll_interval
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def _run(self):
+        # Only events published after the hub started matter; clients get a snapshot first
+        last_id = self.event_queue.latest_event_id()
+
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody is listening; the next subscription restarts the thread
+                    self._thread = None
+                    return
+
+            try:
+                events = self.event_queue.read_events(last_id, timeout=self.poll_interval)
+            except Exception as e:
+                logger.error(f"Error reading events: {str(e)}")
+                events = []
+                threading.Event().wait(self.poll_interval)
+
+            for event_id, channel, data in events:
+                last_id = event_id
+                with self._lock:
+                    subscribers = list(self._subscribers.get(channel, ()))
+                for subscription in subscribers:
+                    subscription.put(data)
+
+
+def _reset_hub():
+    """Drop the hub in a forked child; its thread did not survive the fork"""
+    global _hub
+    _hub = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_hub)
+
+
+def subscribe(channel):
+    """
+    Subscribe the current process to a channel
+
+    Args:
+        channel (str): Channel name, e.g. from batch_channel()
+
+    Returns:
+        Subscription: Call get() for events and close() when done
+    """
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                _hub = EventHub(get_queue(), current_app.config.get('EVENTS_POLL_INTERVAL', 0.5))
+    return _hub.subscribe(channel)
@@ -8,9 +8,91 @@ from google.cloud import vision_v1 as vision
 from flask import current_app
 import uuid
 import logging
+import threading
+import numpy as np
 from google.cloud import vision_v1
 from google.api_core.client_options import ClientOptions
 
+from app.services import metrics
+
+# One ImageAnnotatorClient per API key, shared by every thread in this process
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _reset_clients():
+    """Drop clients inherited from a parent process; gRPC channels do not survive fork()"""
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_clients)
+
+
+def get_vision_client(api_key):
+    """
+    Get the process-wide Vision client for an API key, creating it on first use
+
+    Args:
+        api_key (str): Google Vision API key
+
+    Returns:
+        vision_v1.ImageAnnotatorClient: The shared client
+    """
+    client = _clients.get(api_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(api_key)
+            if client is None:
+                with metrics.histogram('vision_client_create_seconds').time():
+                    client_options = ClientOptions(api_key=api_key)
+                    client = vision_v1.ImageAnnotatorClient(client_options=client_options)
+                _clients[api_key] = client
+    return client
+
+
+def warm_vision_client(app):
+    """
+    Create the Vision client for the app's API key ahead of the first request
+
+    Args:
+        app (Flask): The application whose GOOGLE_VISION_KEY should be warmed
+    """
+    vision_key = app.config.get('GOOGLE_VISION_KEY')
+    if not vision_key:
+        return
+
+    try:
+        get_vision_client(vision_key)
+    except Exception as e:
+        app.logger.warning(f"Could not warm Google Vision client: {str(e)}")
+
+
+def _load_image(image_path):
+    """Build a Vision Image from a file path or raw image bytes"""
+    # Handle both file paths and image bytes
+    if isinstance(image_path, str):
+        # Read the image file from disk
+        with io.open(image_path, 'rb') as image_file:
+            content = image_file.read()
+
+        # Create image object with the correct format
+        return vision.Image(content=content)
+
+    # Assume image_path contains image bytes
+    return vision.Image(content=image_path)
+
+
+def _get_client():
+    """Get the shared Vision client for the configured API key"""
+    vision_key = current_app.config.get('GOOGLE_VISION_KEY')
+    if not vision_key:
+        raise ValueError("Google Vision API key not configured")
+
+    return get_vision_client(vision_key)
+
 
 def detect_text_with_vision(image_path, language_hint='en'):
     """
@@ -26,112 +108,220 @@ def detect_text_with_vision(image_path, language_hint='en'):
     request_id = str(uuid.uuid4())
 
     try:
-        # Get the API key
-        vision_key = current_app.config.get('GOOGLE_VISION_KEY')
-        if not vision_key:
-            raise ValueError("Google Vision API key not configured")
-
-        client_options = ClientOptions(api_key=vision_key)
-        client = vision_v1.ImageAnnotatorClient(client_options=client_options)
-
-        # Handle both file paths and image bytes
-        if isinstance(image_path, str):
-            # Read the image file from disk
-            with io.open(image_path, 'rb') as image_file:
-                content = image_file.read()
-
-            # Create image object with the correct format
-            image = vision.Image(content=content)
-        else:
-            # Assume image_path contains image bytes
-            image = vision.Image(content=image_path)
+        client = _get_client()
+        image = _load_image(image_path)
 
         # Set language hint if provided
-        print(language_hint)
         image_context = vision.ImageContext(language_hints=[language_hint]) if language_hint else None
 
         # Detect text
-        response = client.document_text_detection(
-            image=image,
-            image_context=image_context
-        )
+        with metrics.histogram('vision_request_seconds').time():
+            response = client.document_text_detection(
+                image=image,
+                image_context=image_context
+            )
 
-        # Rest of the function remains the same
-        # Extract full text
-        extracted_text = response.full_text_annotation.text
-
-        # Get detailed text annotations for layout preservation
-        pages_data = []
-        for page in response.full_text_annotation.pages:
-            page_info = {
-                'width': page.width,
-                'height': page.height,
-                'blocks': []
-            }
+        extracted_text, structured_data = parse_annotation(response.full_text_annotation, language_hint)
 
-            for block in page.blocks:
-                block_info = {
-                    'type': 'text' if block.block_type == 1 else 'table',  # 1 is TEXT in BlockType enum
-                    'paragraphs': [],
-                    'bounding_box': [(vertex.x, vertex.y) for vertex in block.bounding_box.vertices]
-                }
-
-                for paragraph in block.paragraphs:
-                    para_info = {
-                        'text': '',
-                        'words': [],
-                        'bounding_box': [(vertex.x, vertex.y) for vertex in paragraph.bounding_box.vertices]
-                    }
+        # Log success
+        current_app.logger.info(f"Google Vision OCR successful for request_id: {request_id}")
 
-                    # Record text style information
-                    styles = []
-                    for word in paragraph.words:
-                        word_text = ''.join([symbol.text for symbol in word.symbols])
-                        word_info = {
-                            'text': word_text,
-                            'confidence': word.confidence,
-                            'bounding_box': [(vertex.x, vertex.y) for vertex in word.bounding_box.vertices]
-                        }
+        return extracted_text, structured_data, request_id
 
-                        # Extract style information from symbols
-                        for symbol in word.symbols:
-                            if symbol.property and symbol.property.detected_break:
-                                break_type = symbol.property.detected_break.type
-                                if break_type in [1, 2, 3]:  # SPACE, SURE_SPACE, LINE_BREAK
-                                    word_info['break_after'] = break_type
+    except Exception as e:
+        current_app.logger.error(f"Google Vision API error: {str(e)}")
+        raise Exception(f"Error processing image with Google Vision: {str(e)}")
 
-                            # Detect style from symbol properties
-                            if symbol.property and symbol.property.detected_languages:
-                                word_info['language'] = symbol.property.detected_languages[0].language_code
 
-                        para_info['words'].append(word_info)
-                        para_info['text'] += word_text + ' '
+def detect_text_with_vision_batch(image_paths, language_hint='en'):
+    """
+    Detects text in several images with a single batch_annotate_images call
 
-                    para_info['text'] = para_info['text'].strip()
-                    block_info['paragraphs'].append(para_info)
+    Args:
+        image_paths (list): Paths to the image files (or image bytes), at most VISION_BATCH_SIZE
+        language_hint (str): Language hint for OCR, shared by every image
 
-                page_info['blocks'].append(block_info)
+    Returns:
+        list: One entry per image, in order. Each entry is either an
+            (extracted_text, structured_data, request_id) tuple or the Exception
+            raised for that image.
+    """
+    max_batch = current_app.config.get('VISION_BATCH_SIZE', 16)
+    if len(image_paths) > max_batch:
+        raise ValueError(f"At most {max_batch} images can be sent in one Vision batch request")
 
-            pages_data.append(page_info)
+    try:
+        client = _get_client()
 
-        # Extract tables based on layout analysis
-        tables = extract_tables_from_blocks(pages_data)
+        image_context = vision.ImageContext(language_hints=[language_hint]) if language_hint else None
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        requests = [
+            vision.AnnotateImageRequest(
+                image=_load_image(image_path),
+                features=[feature],
+                image_context=image_context
+            )
+            for image_path in image_paths
+        ]
+
+        with metrics.histogram('vision_batch_request_seconds').time():
+            batch_response = client.batch_annotate_images(requests=requests)
 
-        # Create structured data
-        structured_data = {
-            'pages': pages_data,
-            'tables': tables,
-            'language': language_hint
-        }
+    except Exception as e:
+        current_app.logger.error(f"Google Vision API batch error: {str(e)}")
+        raise Exception(f"Error processing images with Google Vision: {str(e)}")
 
-        # Log success
-        current_app.logger.info(f"Google Vision OCR successful for request_id: {request_id}")
+    # Split the responses back out, keeping per-image failures separate
+    results = []
+    for response in batch_response.responses:
+        request_id = str(uuid.uuid4())
+        if response.error.message:
+            results.append(Exception(f"Error processing image with Google Vision: {response.error.message}"))
+            continue
+
+        try:
+            extracted_text, structured_data = parse_annotation(response.full_text_annotation, language_hint)
+            results.append((extracted_text, structured_data, request_id))
+        except Exception as e:
+            results.append(Exception(f"Error processing image with Google Vision: {str(e)}"))
+
+    current_app.logger.info(f"Google Vision batch OCR finished for {len(results)} images")
+
+    return results
 
-        return extracted_text, structured_data, request_id
+
+def detect_text_in_file(content, pages, language_hint='en', mime_type='application/pdf'):
+    """
+    Detects text in some pages of a PDF with a single batch_annotate_files call
+
+    Vision extracts and renders the pages itself, so nothing is rasterized here.
+
+    Args:
+        content (bytes): The whole file
+        pages (list): 1-based page numbers, at most 5. An empty list means the first 5 pages.
+        language_hint (str): Language hint for OCR
+        mime_type (str): Content type of the file
+
+    Returns:
+        tuple: (total_pages, results) where results holds one (extracted_text, structured_data)
+            tuple per requested page that exists, in page order
+
+    Raises:
+        Exception: If the request or any of its pages fails
+    """
+    try:
+        client = _get_client()
+
+        image_context = vision.ImageContext(language_hints=[language_hint]) if language_hint else None
+        request = vision.AnnotateFileRequest(
+            input_config=vision.InputConfig(content=content, mime_type=mime_type),
+            features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+            image_context=image_context,
+            pages=pages
+        )
+
+        with metrics.histogram('vision_file_request_seconds').time():
+            file_response = client.batch_annotate_files(requests=[request]).responses[0]
+
+        if file_response.error.message:
+            raise Exception(file_response.error.message)
+
+        results = []
+        for response in sorted(file_response.responses, key=lambda r: r.context.page_number):
+            if response.error.message:
+                raise Exception(f"page {response.context.page_number}: {response.error.message}")
+            results.append(parse_annotation(response.full_text_annotation, language_hint))
+
+        return file_response.total_pages, results
 
     except Exception as e:
-        current_app.logger.error(f"Google Vision API error: {str(e)}")
-        raise Exception(f"Error processing image with Google Vision: {str(e)}")
+        current_app.logger.error(f"Google Vision API file error: {str(e)}")
+        raise Exception(f"Error processing file with Google Vision: {str(e)}")
+
+
+def _box(bounding_poly):
+    return [(vertex.x, vertex.y) for vertex in bounding_poly.vertices]
+
+
+def parse_annotation(annotation, language_hint='en'):
+    """
+    Convert a Vision full_text_annotation into the structured data used by the generators
+
+    Works on the raw protobuf fields rather than the proto-plus wrappers, which
+    build a Python object on every attribute access and made this conversion
+    cost more than the RPC on dense pages.
+
+    Args:
+        annotation: full_text_annotation from a Vision response (proto-plus or raw protobuf)
+        language_hint (str): Language hint used for the request
+
+    Returns:
+        tuple: (extracted_text, structured_data)
+    """
+    if isinstance(annotation, vision.TextAnnotation):
+        annotation = vision.TextAnnotation.pb(annotation)
+
+    # Extract full text
+    extracted_text = annotation.text
+
+    # Get detailed text annotations for layout preservation
+    pages_data = []
+    for page in annotation.pages:
+        blocks = []
+        for block in page.blocks:
+            paragraphs = []
+            for paragraph in block.paragraphs:
+                words = []
+                for word in paragraph.words:
+                    symbols = word.symbols
+                    word_info = {
+                        'text': ''.join([symbol.text for symbol in symbols]),
+                        'confidence': word.confidence,
+                        'bounding_box': _box(word.bounding_box)
+                    }
+
+                    # The last symbol with a space or line break (and the last with a detected
+                    # language) wins; it is almost always the final one, so search backwards
+                    for symbol in reversed(symbols):
+                        if symbol.property.detected_break.type_ in (1, 2, 3):  # SPACE, SURE_SPACE, LINE_BREAK
+                            word_info['break_after'] = symbol.property.detected_break.type_
+                            break
+                    for symbol in reversed(symbols):
+                        if symbol.property.detected_languages:
+                            word_info['language'] = symbol.property.detected_languages[0].language_code
+                            break
+
+                    words.append(word_info)
+
+                paragraphs.append({
+                    'text': ' '.join([word_info['text'] for word_info in words]).strip(),
+                    'words': words,
+                    'bounding_box': _box(paragraph.bounding_box)
+                })
+
+            blocks.append({
+                'type': 'text' if block.block_type == 1 else 'table',  # 1 is TEXT in BlockType enum
+                'paragraphs': paragraphs,
+                'bounding_box': _box(block.bounding_box)
+            })
+
+        pages_data.append({
+            'width': page.width,
+            'height': page.height,
+            'blocks': blocks
+        })
+
+    # Extract tables based on layout analysis
+    tables = extract_tables_from_blocks(pages_data)
+
+    # Create structured data
+    structured_data = {
+        'pages': pages_data,
+        'tables': tables,
+        'language': language_hint
+    }
+
+    return extracted_text, structured_data
 
 
 def extract_tables_from_blocks(pages_data):
@@ -212,78 +402,105 @@ def extract_table_from_block(block):
     """
     Extract table structure from a block
 
+    Paragraphs are clustered into rows (by top edge) and columns (by left edge)
+    with a sort + gap split, so the cost stays O(n log n) on dense forms.
+
     Args:
         block (dict): Block data from OCR
 
     Returns:
-        dict: Table structure with rows and cells
+        dict: Table structure with a padded row/column grid of cell text and the
+            cells with their row and column spans
     """
     if len(block['paragraphs']) < 2:
         return None
 
+    # Get bounding box to determine table dimensions
+    if not block.get('bounding_box'):
+        return None
+
+    block_box = np.asarray(block['bounding_box'], dtype=float)
+    table_width = block_box[:, 0].max() - block_box[:, 0].min()
+    table_height = block_box[:, 1].max() - block_box[:, 1].min()
+
     # Extract paragraphs and their positions
-    paragraphs = block['paragraphs']
-    paragraph_positions = []
+    paragraphs = [para for para in block['paragraphs'] if len(para.get('bounding_box') or []) == 4]
+    if not paragraphs:
+        return None
 
-    for para in paragraphs:
-        if 'bounding_box' in para:
-            # Calculate para center point
-            x_values = [vertex[0] for vertex in para['bounding_box']]
-            y_values = [vertex[1] for vertex in para['bounding_box']]
-            center_x = sum(x_values) / len(x_values)
-            center_y = sum(y_values) / len(y_values)
+    boxes = np.asarray([para['bounding_box'] for para in paragraphs], dtype=float)  # (n, 4 vertices, x/y)
+    x_min, x_max = boxes[:, :, 0].min(axis=1), boxes[:, :, 0].max(axis=1)
+    y_min, y_max = boxes[:, :, 1].min(axis=1), boxes[:, :, 1].max(axis=1)
+
+    # Use a tolerance to group paragraphs that are approximately on the same line / column.
+    # It is capped by the typical line height so dense forms with many rows don't collapse.
+    line_height = float(np.median(y_max - y_min))
+    y_tolerance = min(table_height * 0.05, line_height * 0.5)  # 5% of table height
+    x_tolerance = min(table_width * 0.05, line_height)  # 5% of table width
+
+    row_labels, row_positions = _cluster_positions(y_min, y_tolerance)
+    col_labels, col_positions = _cluster_positions(x_min, x_tolerance)
+    n_rows, n_cols = len(row_positions), len(col_positions)
+
+    # A paragraph spans every later row / column whose starting edge it covers
+    col_spans = np.searchsorted(col_positions, x_max - x_tolerance, side='right') - col_labels
+    row_spans = np.searchsorted(row_positions, y_max - y_tolerance, side='right') - row_labels
+    col_spans = np.clip(col_spans, 1, n_cols - col_labels)
+    row_spans = np.clip(row_spans, 1, n_rows - row_labels)
+
+    # Fill the grid in reading order; paragraphs that land in the same cell are joined
+    table_rows = [[''] * n_cols for _ in range(n_rows)]
+    cells = {}
+    for idx in np.lexsort((x_min, row_labels)):
+        row, col = int(row_labels[idx]), int(col_labels[idx])
+        text = paragraphs[idx]['text']
+        table_rows[row][col] = f"{table_rows[row][col]} {text}" if table_rows[row][col] else text
+
+        cell = cells.get((row, col))
+        if cell is None:
+            cells[(row, col)] = {
+                'row': row,
+                'col': col,
+                'row_span': int(row_spans[idx]),
+                'col_span': int(col_spans[idx]),
+                'text': text
+            }
+        else:
+            cell['text'] = table_rows[row][col]
+            cell['row_span'] = max(cell['row_span'], int(row_spans[idx]))
+            cell['col_span'] = max(cell['col_span'], int(col_spans[idx]))
 
-            paragraph_positions.append({
-                'text': para['text'],
-                'x': center_x,
-                'y': center_y
-            })
+    return {
+        'rows': table_rows,
+        'cells': [cells[key] for key in sorted(cells)],
+        'columns': n_cols,
+        'width': float(table_width),
+        'height': float(table_height)
+    }
 
-    # Get bounding box to determine table dimensions
-    if 'bounding_box' in block:
-        # Get min/max coordinates
-        x_values = [v[0] for v in block['bounding_box']]
-        y_values = [v[1] for v in block['bounding_box']]
-        min_x, max_x = min(x_values), max(x_values)
-        min_y, max_y = min(y_values), max(y_values)
-
-        # Estimate table dimensions
-        table_width = max_x - min_x
-        table_height = max_y - min_y
-    else:
-        return None
 
-    # Group paragraphs by y-position (rows)
-    # Use a tolerance to group paragraphs that are approximately on the same line
-    y_tolerance = table_height * 0.05  # 5% of table height
+def _cluster_positions(values, tolerance):
+    """
+    Cluster 1-D positions by sorting them and splitting wherever the gap exceeds the tolerance
 
-    rows_by_y = {}
-    for para in paragraph_positions:
-        # Find a row that this paragraph belongs to
-        row_found = False
-        for row_y in rows_by_y.keys():
-            if abs(para['y'] - row_y) < y_tolerance:
-                rows_by_y[row_y].append(para)
-                row_found = True
-                break
+    Args:
+        values (numpy.ndarray): Positions to cluster
+        tolerance (float): Largest gap allowed inside one cluster
 
-        if not row_found:
-            rows_by_y[para['y']] = [para]
+    Returns:
+        tuple: (cluster label for each value in input order, smallest position of each cluster)
+    """
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
 
-    # Sort rows by y-position
-    sorted_row_ys = sorted(rows_by_y.keys())
+    # A new cluster starts after every gap wider than the tolerance
+    sorted_labels = np.concatenate(([0], np.cumsum(np.diff(sorted_values) > tolerance)))
 
-    # For each row, sort paragraphs by x-position
-    table_rows = []
-    for row_y in sorted_row_ys:
-        row_paragraphs = sorted(rows_by_y[row_y], key=lambda p: p['x'])
-        table_rows.append([p['text'] for p in row_paragraphs])
+    labels = np.empty_like(sorted_labels)
+    labels[order] = sorted_labels
 
-    return {
-        'rows': table_rows,
-        'width': table_width,
-        'height': table_height
-    }
+    starts = np.flatnonzero(np.concatenate(([True], np.diff(sorted_labels) > 0)))
+    return labels, sorted_values[starts]
 
 
 def detect_formatting(paragraph):
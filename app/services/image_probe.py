@@ -0,0 +1,233 @@
+"""
+Image Probe Service - Reads image format and dimensions from file headers
+
+Only the few bytes that hold the format, size and frame information are read,
+never the pixel data, so validation takes microseconds per image and a
+decompression bomb is rejected before anything tries to decode it.
+"""
+import struct
+from collections import namedtuple
+
+# JPEG start-of-frame markers (SOF0-SOF15, minus DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageInfo(namedtuple('ImageInfo', ['format', 'width', 'height', 'multi_frame'])):
+    """Format, dimensions and whether the file holds more than one frame or page"""
+
+    @property
+    def pixels(self):
+        return self.width * self.height
+
+
+def _read(f, offset, size):
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) < size:
+        raise ValueError('Truncated image header')
+    return data
+
+
+def _probe_png(f):
+    width, height = struct.unpack('>II', _read(f, 16, 8))
+
+    # APNG files announce their animation in an acTL chunk before the first IDAT
+    offset = 8
+    while True:
+        length, chunk_type = struct.unpack('>I4s', _read(f, offset, 8))
+        if chunk_type == b'acTL':
+            return ImageInfo('png', width, height, True)
+        if chunk_type in (b'IDAT', b'IEND'):
+            return ImageInfo('png', width, height, False)
+        offset += 12 + length
+
+
+def _skip_sub_blocks(f, offset, block_size=64 * 1024):
+    """Return the offset just past a chain of GIF data sub-blocks"""
+    # Only the length bytes matter; read ahead in blocks rather than seeking to each one
+    start, buffer = offset, b''
+    while True:
+        index = offset - start
+        if index >= len(buffer):
+            f.seek(offset)
+            start, buffer, index = offset, f.read(block_size), 0
+            if not buffer:
+                raise ValueError('Truncated image header')
+        size = buffer[index]
+        offset += 1 + size
+        if not size:
+            return offset
+
+
+def _probe_gif(f):
+    width, height, flags = struct.unpack('<HHB', _read(f, 6, 5))
+
+    offset = 13
+    if flags & 0x80:
+        offset += 3 * 2 ** ((flags & 0x07) + 1)
+
+    frames = 0
+    while True:
+        introducer = _read(f, offset, 1)
+        if introducer == b';':
+            return ImageInfo('gif', width, height, frames > 1)
+
+        if introducer == b',':
+            frames += 1
+            if frames > 1:
+                return ImageInfo('gif', width, height, True)
+            # Skip the image descriptor, local color table, LZW code size and image data
+            local_flags = _read(f, offset + 9, 1)[0]
+            offset += 10
+            if local_flags & 0x80:
+                offset += 3 * 2 ** ((local_flags & 0x07) + 1)
+            offset = _skip_sub_blocks(f, offset + 1)
+        elif introducer == b'!':
+            label, size = struct.unpack('BB', _read(f, offset + 1, 2))
+            # Animated GIFs usually announce looping before the first frame
+            if label == 0xFF and _read(f, offset + 3, min(size, 11)) in (b'NETSCAPE2.0', b'ANIMEXTS1.0'):
+                return ImageInfo('gif', width, height, True)
+            offset = _skip_sub_blocks(f, offset + 2)
+        else:
+            raise ValueError('Invalid GIF block')
+
+
+def _probe_jpeg(f):
+    offset = 2
+    multi_frame = False
+    while True:
+        marker, segment_type, length = struct.unpack('>BBH', _read(f, offset, 4))
+        if marker != 0xFF:
+            raise ValueError('Invalid JPEG marker')
+        if segment_type == 0xE2 and _read(f, offset + 4, 4) == b'MPF\x00':
+            # Multi-Picture Format (MPO), e.g. stereo or burst photos
+            multi_frame = True
+        if segment_type in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', _read(f, offset + 5, 4))
+            return ImageInfo('jpeg', width, height, multi_frame)
+        if segment_type in (0xD9, 0xDA):
+            raise ValueError('JPEG has no frame header')
+        offset += 2 + length
+
+
+def _probe_bmp(f):
+    header_size = struct.unpack('<I', _read(f, 14, 4))[0]
+    if header_size == 12:
+        width, height = struct.unpack('<HH', _read(f, 18, 4))
+    else:
+        width, height = struct.unpack('<ii', _read(f, 18, 8))
+    # Negative heights mark top-down bitmaps
+    return ImageInfo('bmp', abs(width), abs(height), False)
+
+
+def _probe_tiff(f):
+    endian = '<' if _read(f, 0, 2) == b'II' else '>'
+    ifd_offset = struct.unpack(endian + 'I', _read(f, 4, 4))[0]
+    count = struct.unpack(endian + 'H', _read(f, ifd_offset, 2))[0]
+    entries = _read(f, ifd_offset + 2, count * 12 + 4)
+
+    width = height = None
+    for i in range(count):
+        tag, field_type = struct.unpack(endian + 'HH', entries[i * 12:i * 12 + 4])
+        if tag in (256, 257):
+            # SHORT or LONG value stored inline
+            value_format = 'H' if field_type == 3 else 'I'
+            value = struct.unpack_from(endian + value_format, entries, i * 12 + 8)[0]
+            if tag == 256:
+                width = value
+            else:
+                height = value
+
+    if width is None or height is None:
+        raise ValueError('TIFF has no image dimensions')
+
+    # A non-zero offset to a next IFD means more pages
+    next_ifd = struct.unpack(endian + 'I', entries[count * 12:count * 12 + 4])[0]
+    return ImageInfo('tiff', width, height, next_ifd != 0)
+
+
+def count_tiff_pages(path, max_pages=None):
+    """
+    Count the pages of a TIFF by walking its chain of IFDs
+
+    Args:
+        path (str): Path to a TIFF file
+        max_pages (int): Stop counting once this many pages have been seen
+
+    Returns:
+        int: Number of pages, or max_pages + 1 if there are more than max_pages
+
+    Raises:
+        ValueError: If the file is not a TIFF or its IFD chain is damaged
+    """
+    with open(path, 'rb') as f:
+        try:
+            byte_order = _read(f, 0, 2)
+            if byte_order not in (b'II', b'MM'):
+                raise ValueError('Not a TIFF file')
+            endian = '<' if byte_order == b'II' else '>'
+
+            pages, seen = 0, set()
+            ifd_offset = struct.unpack(endian + 'I', _read(f, 4, 4))[0]
+            while ifd_offset:
+                # A loop in the chain would otherwise never end
+                if ifd_offset in seen:
+                    raise ValueError('TIFF page chain loops')
+                seen.add(ifd_offset)
+                pages += 1
+                if max_pages is not None and pages > max_pages:
+                    break
+                count = struct.unpack(endian + 'H', _read(f, ifd_offset, 2))[0]
+                ifd_offset = struct.unpack(endian + 'I', _read(f, ifd_offset + 2 + count * 12, 4))[0]
+            return pages
+        except struct.error:
+            raise ValueError('Damaged image header')
+
+
+def _probe_webp(f):
+    chunk = _read(f, 12, 4)
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', _read(f, 26, 4))
+        return ImageInfo('webp', width & 0x3FFF, height & 0x3FFF, False)
+    if chunk == b'VP8L':
+        bits = struct.unpack('<I', _read(f, 21, 4))[0]
+        return ImageInfo('webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1, False)
+    if chunk == b'VP8X':
+        data = _read(f, 20, 10)
+        width = int.from_bytes(data[4:7], 'little') + 1
+        height = int.from_bytes(data[7:10], 'little') + 1
+        return ImageInfo('webp', width, height, bool(data[0] & 0x02))
+    raise ValueError('Unknown WebP chunk')
+
+
+def probe_image(path):
+    """
+    Read an image's format, dimensions and frame information from its header
+
+    Args:
+        path (str): Path to a JPEG, PNG, GIF, BMP, TIFF or WebP file
+
+    Returns:
+        ImageInfo: The image information
+
+    Raises:
+        ValueError: If the file is not a supported image or its header is damaged
+    """
+    with open(path, 'rb') as f:
+        signature = f.read(12)
+        try:
+            if signature.startswith(b'\x89PNG\r\n\x1a\n'):
+                return _probe_png(f)
+            if signature[:6] in (b'GIF87a', b'GIF89a'):
+                return _probe_gif(f)
+            if signature.startswith(b'\xff\xd8'):
+                return _probe_jpeg(f)
+            if signature.startswith(b'BM'):
+                return _probe_bmp(f)
+            if signature[:4] in (b'II*\x00', b'MM\x00*'):
+                return _probe_tiff(f)
+            if signature[:4] == b'RIFF' and signature[8:12] == b'WEBP':
+                return _probe_webp(f)
+        except struct.error:
+            raise ValueError('Damaged image header')
+    raise ValueError('Unsupported image format')
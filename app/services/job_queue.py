@@ -0,0 +1,339 @@
+"""
+Job Queue Service - Hands OCR and document generation off to background workers
+
+Jobs are small JSON payloads (usually just a document id) pushed onto a queue
+backend. Web requests only enqueue; one or more `worker.py` processes drain the
+queue and run the registered handler for each job type. Jobs claimed by a
+worker that dies are put back on the queue after JOB_VISIBILITY_TIMEOUT
+seconds. Each backend also keeps a short log of status events that workers
+publish for the web processes.
+
+Two backends are supported:
+    - 'sqlite' (default): a local SQLite file, no extra services required
+    - 'redis': any Redis-compatible server, requires the `redis` package
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+import logging
+from contextlib import closing
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Registered job handlers, keyed by job type
+_handlers = {}
+
+# Queue backends, keyed by (backend, location) so each app config gets one instance
+_queues = {}
+
+
+def job_handler(job_type):
+    """
+    Register a function as the handler for a job type
+
+    Args:
+        job_type (str): Name of the job type, e.g. 'process_document'
+
+    Returns:
+        function: Decorator that registers the handler
+    """
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+class SQLiteQueue:
+    """Job queue stored in a local SQLite database file"""
+
+    def __init__(self, path, visibility_timeout=600):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' job_type TEXT NOT NULL,'
+                ' payload TEXT NOT NULL,'
+                " status TEXT NOT NULL DEFAULT 'queued',"
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' error TEXT,'
+                ' created_at REAL NOT NULL,'
+                ' started_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs (status, created_at)')
+
+            # Append-only log of status events, tailed by the web processes (see events.py)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' channel TEXT NOT NULL,'
+                ' data TEXT NOT NULL,'
+                ' created_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        # A fresh connection per call keeps the queue safe across threads and forked workers
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def enqueue(self, job_type, payload):
+        job_id = uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, job_type, payload, created_at) VALUES (?, ?, ?, ?)',
+                (job_id, job_type, json.dumps(payload), time.time())
+            )
+        return job_id
+
+    def dequeue(self):
+        """Atomically claim the oldest queued job, or return None if the queue is empty"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+
+            # Jobs claimed by a worker that died are put back on the queue
+            conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND started_at < ?",
+                (now - self.visibility_timeout,)
+            )
+
+            row = conn.execute(
+                "SELECT id, job_type, payload FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (now, row[0])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        if not row:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def complete(self, job_id):
+        with closing(self._connect()) as conn:
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def fail(self, job_id, error):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET status = 'failed', error = ? WHERE id = ?", (error, job_id))
+
+    def publish_event(self, channel, data, retention=3600):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                'INSERT INTO events (channel, data, created_at) VALUES (?, ?, ?)',
+                (channel, json.dumps(data), now)
+            )
+            # Trim the log now and then; subscribers only ever need recent events
+            if cursor.lastrowid % 100 == 0:
+                conn.execute('DELETE FROM events WHERE created_at < ?', (now - retention,))
+
+    def latest_event_id(self):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT MAX(id) FROM events').fetchone()
+        return row[0] or 0
+
+    def read_events(self, after_id, timeout=0.5):
+        """Return (event_id, channel, data) tuples newer than after_id, waiting up to timeout if there are none"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT id, channel, data FROM events WHERE id > ? ORDER BY id LIMIT 1000',
+                (after_id,)
+            ).fetchall()
+        if not rows:
+            time.sleep(timeout)
+        return [(event_id, channel, json.loads(data)) for event_id, channel, data in rows]
+
+
+class RedisQueue:
+    """Job queue stored in a Redis list, with a processing list for in-flight jobs"""
+
+    def __init__(self, url, name='docgen:jobs', visibility_timeout=600, reap_interval=60):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.name = name
+        self.processing = f"{name}:processing"
+        # When each in-flight job was claimed, keyed by job id
+        self.claimed = f"{name}:claimed"
+        self.visibility_timeout = visibility_timeout
+        self.reap_interval = reap_interval
+        self._in_flight = {}
+        self._last_reap = None
+
+    def enqueue(self, job_type, payload):
+        job_id = uuid.uuid4().hex
+        self.client.lpush(self.name, json.dumps({'id': job_id, 'type': job_type, 'payload': payload}))
+        return job_id
+
+    def dequeue(self, timeout=1):
+        # Check for jobs abandoned by dead workers when the worker starts, then every reap_interval
+        if self._last_reap is None or time.monotonic() - self._last_reap > self.reap_interval:
+            self.requeue_stale()
+            self._last_reap = time.monotonic()
+
+        raw = self.client.brpoplpush(self.name, self.processing, timeout=timeout)
+        if raw is None:
+            return None
+        job = json.loads(raw)
+        self.client.hset(self.claimed, job['id'], time.time())
+        self._in_flight[job['id']] = raw
+        return job['id'], job['type'], job['payload']
+
+    def requeue_stale(self):
+        """
+        Put jobs claimed more than visibility_timeout ago back on the queue
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        now = time.time()
+        requeued = 0
+        for raw in self.client.lrange(self.processing, 0, -1):
+            job_id = json.loads(raw)['id']
+            # A job just moved here may not have its claim time yet; start its clock now
+            self.client.hsetnx(self.claimed, job_id, now)
+            claimed_at = float(self.client.hget(self.claimed, job_id) or now)
+            if now - claimed_at < self.visibility_timeout:
+                continue
+
+            # Only the worker whose LREM removes the entry puts it back, so it is requeued once
+            if self.client.lrem(self.processing, 1, raw):
+                self.client.hdel(self.claimed, job_id)
+                # The right end is dequeued next, so a recovered job doesn't wait behind new ones
+                self.client.rpush(self.name, raw)
+                requeued += 1
+                logger.warning(f"Requeued job {job_id}, claimed {now - claimed_at:.0f}s ago")
+        return requeued
+
+    def complete(self, job_id):
+        raw = self._in_flight.pop(job_id, None)
+        if raw is not None:
+            self.client.lrem(self.processing, 1, raw)
+            self.client.hdel(self.claimed, job_id)
+
+    def fail(self, job_id, error):
+        logger.error(f"Job {job_id} failed: {error}")
+        self.complete(job_id)
+
+    def publish_event(self, channel, data, max_events=10000):
+        self.client.xadd(f"{self.name}:events", {'channel': channel, 'data': json.dumps(data)},
+                         maxlen=max_events, approximate=True)
+
+    def latest_event_id(self):
+        entries = self.client.xrevrange(f"{self.name}:events", count=1)
+        return entries[0][0].decode() if entries else '0-0'
+
+    def read_events(self, after_id, timeout=0.5):
+        """Return (event_id, channel, data) tuples newer than after_id, waiting up to timeout if there are none"""
+        streams = self.client.xread({f"{self.name}:events": after_id}, count=1000, block=int(timeout * 1000))
+        events = []
+        for _, entries in streams or []:
+            for event_id, fields in entries:
+                events.append((event_id.decode(), fields[b'channel'].decode(), json.loads(fields[b'data'])))
+        return events
+
+
+def get_queue(app=None):
+    """
+    Get the queue backend configured for the app
+
+    Args:
+        app (Flask, optional): Application to read the configuration from, defaults to current_app
+
+    Returns:
+        SQLiteQueue or RedisQueue: The queue backend
+    """
+    config = (app or current_app).config
+    backend = config.get('JOB_QUEUE_BACKEND', 'sqlite')
+
+    if backend == 'redis':
+        key = (backend, config['JOB_QUEUE_URL'])
+        if key not in _queues:
+            _queues[key] = RedisQueue(config['JOB_QUEUE_URL'],
+                                      visibility_timeout=config.get('JOB_VISIBILITY_TIMEOUT', 600))
+    elif backend == 'sqlite':
+        key = (backend, config['JOB_QUEUE_PATH'])
+        if key not in _queues:
+            _queues[key] = SQLiteQueue(config['JOB_QUEUE_PATH'], config.get('JOB_VISIBILITY_TIMEOUT', 600))
+    else:
+        raise ValueError(f"Unsupported job queue backend: {backend}")
+
+    return _queues[key]
+
+
+def enqueue(job_type, **payload):
+    """
+    Push a job onto the configured queue
+
+    Args:
+        job_type (str): Registered job type
+        **payload: JSON-serializable job arguments
+
+    Returns:
+        str: The job ID
+    """
+    job_id = get_queue().enqueue(job_type, payload)
+    current_app.logger.info(f"Enqueued {job_type} job {job_id}: {payload}")
+    return job_id
+
+
+def run_job(app, job_type, payload):
+    """Run a single job inside an application context"""
+    handler = _handlers.get(job_type)
+    if handler is None:
+        raise ValueError(f"No handler registered for job type: {job_type}")
+
+    from app import db
+    with app.app_context():
+        try:
+            handler(**payload)
+        finally:
+            db.session.remove()
+
+
+def run_worker(app, burst=False):
+    """
+    Drain the job queue, running each job with its registered handler
+
+    Args:
+        app (Flask): The application to run jobs against
+        burst (bool): Stop once the queue is empty instead of waiting for new jobs
+    """
+    # Importing the processing service registers its job handlers
+    from app.services import processing_service  # noqa: F401
+
+    queue = get_queue(app)
+    poll_interval = app.config.get('WORKER_POLL_INTERVAL', 1.0)
+    app.logger.info(f"Worker {os.getpid()} started on {app.config.get('JOB_QUEUE_BACKEND', 'sqlite')} queue")
+
+    while True:
+        job = queue.dequeue()
+        if job is None:
+            if burst:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        job_id, job_type, payload = job
+        try:
+            run_job(app, job_type, payload)
+            queue.complete(job_id)
+        except Exception as e:
+            app.logger.error(f"Job {job_id} ({job_type}) failed: {str(e)}")
+            queue.fail(job_id, str(e))
@@ -0,0 +1,100 @@
+"""
+Metrics Service - Lightweight in-process counters and latency histograms
+
+Metrics live in the memory of each process (web worker or job worker) and are
+exposed as JSON on the /metrics endpoint.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {'type': 'counter', 'value': self.value}
+
+
+class Histogram:
+    """Cumulative histogram of observed values, in the style of Prometheus"""
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    @contextmanager
+    def time(self):
+        """Observe the wall-clock duration of the wrapped block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'type': 'histogram',
+                'count': self.count,
+                'sum': round(self.sum, 6),
+                'avg': round(self.sum / self.count, 6) if self.count else None,
+                'buckets': {str(bound): n for bound, n in zip(self.buckets, self.counts)}
+            }
+
+
+def _get_or_create(name, factory):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = _registry[name] = factory()
+    return metric
+
+
+def counter(name):
+    """Get or create the counter with the given name"""
+    return _get_or_create(name, lambda: Counter(name))
+
+
+def histogram(name, buckets=DEFAULT_BUCKETS):
+    """Get or create the histogram with the given name"""
+    return _get_or_create(name, lambda: Histogram(name, buckets))
+
+
+def snapshot():
+    """
+    Get the current value of every registered metric
+
+    Returns:
+        dict: Metric snapshots keyed by metric name
+    """
+    return {name: metric.snapshot() for name, metric in sorted(_registry.items())}
@@ -0,0 +1,70 @@
+"""
+OCR Cache - Reuses Vision results for images that were already processed
+
+Results are keyed by the SHA-256 of the uploaded bytes and the OCR language,
+so re-uploading the same scan (for example to get another output format)
+skips the Vision call entirely.
+"""
+from flask import current_app
+
+from app.services.cache_service import get_cache
+from app.services.ocr_storage import pack, unpack
+
+# Bump when the structured data layout changes so stale entries are ignored
+OCR_CACHE_VERSION = 2
+
+
+def _get_ocr_cache():
+    config = current_app.config
+    if not config.get('OCR_CACHE_ENABLED'):
+        return None
+
+    return get_cache('ocr', config['OCR_CACHE_DIR'], config['OCR_CACHE_MAX_BYTES'], config.get('OCR_CACHE_TTL'))
+
+
+def get_cached_ocr(content_hash, language):
+    """
+    Look up a previous OCR result for the same image bytes and language
+
+    Args:
+        content_hash (str): SHA-256 hex digest of the uploaded file
+        language (str): OCR language hint
+
+    Returns:
+        tuple: (ocr_text, structured_data), or None if there is no cached result
+    """
+    cache = _get_ocr_cache()
+    if cache is None or not content_hash:
+        return None
+
+    raw = cache.get(cache.make_key(OCR_CACHE_VERSION, content_hash, language))
+    if raw is None:
+        return None
+
+    try:
+        entry = unpack(raw)
+        return entry['text'], entry['structured_data']
+    except (ValueError, KeyError, TypeError):
+        current_app.logger.warning(f"Ignoring corrupt OCR cache entry for {content_hash}")
+        return None
+
+
+def store_ocr(content_hash, language, ocr_text, structured_data):
+    """
+    Save an OCR result for later uploads of the same image
+
+    Args:
+        content_hash (str): SHA-256 hex digest of the uploaded file
+        language (str): OCR language hint
+        ocr_text (str): Raw OCR text
+        structured_data (dict): Structured OCR data
+    """
+    cache = _get_ocr_cache()
+    if cache is None or not content_hash:
+        return
+
+    try:
+        data = pack({'text': ocr_text, 'structured_data': structured_data})
+        cache.set(cache.make_key(OCR_CACHE_VERSION, content_hash, language), data)
+    except Exception as e:
+        current_app.logger.warning(f"Could not cache OCR result for {content_hash}: {str(e)}")
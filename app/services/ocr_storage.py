@@ -0,0 +1,70 @@
+"""
+OCR Storage - Compact, versioned binary encoding for structured OCR data
+
+The Vision page/block/paragraph/word tree is large and very repetitive, so it
+is stored as msgpack (falling back to JSON when msgpack is not installed)
+compressed with zlib. Every blob starts with a small header naming its format,
+so older blobs stay readable when the default encoding changes.
+"""
+import json
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is optional
+    msgpack = None
+
+MAGIC = b'DGS'
+
+# Blob formats
+FORMAT_JSON_ZLIB = 1
+FORMAT_MSGPACK_ZLIB = 2
+
+_HEADER = struct.Struct('>3sB')
+
+
+def pack(data, compression_level=6):
+    """
+    Encode structured data into a compact binary blob
+
+    Args:
+        data: JSON-compatible structured data
+        compression_level (int): zlib compression level
+
+    Returns:
+        bytes: The encoded blob
+    """
+    if msgpack is not None:
+        fmt = FORMAT_MSGPACK_ZLIB
+        raw = msgpack.packb(data, use_bin_type=True)
+    else:
+        fmt = FORMAT_JSON_ZLIB
+        raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    return _HEADER.pack(MAGIC, fmt) + zlib.compress(raw, compression_level)
+
+
+def unpack(blob):
+    """
+    Decode a blob produced by pack()
+
+    Args:
+        blob (bytes): The encoded blob
+
+    Returns:
+        The structured data
+    """
+    magic, fmt = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not a structured data blob")
+
+    raw = zlib.decompress(blob[_HEADER.size:])
+    if fmt == FORMAT_MSGPACK_ZLIB:
+        if msgpack is None:
+            raise ValueError("msgpack is required to read this structured data")
+        return msgpack.unpackb(raw, raw=False)
+    if fmt == FORMAT_JSON_ZLIB:
+        return json.loads(raw)
+
+    raise ValueError(f"Unknown structured data format: {fmt}")
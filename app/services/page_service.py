@@ -0,0 +1,210 @@
+"""
+Page Service - Runs OCR on every page of a multi-page TIFF or PDF
+
+Vision only reads the first page of an image, so multi-page uploads take their
+own path. A TIFF is split into one preprocessed JPEG per page in the
+preprocessing pool, decoding a single page at a time. A PDF is sent as a file,
+a few pages per request, and Vision extracts the pages itself. Either way the
+page requests run concurrently and the results are merged, in page order,
+into one structured_data.
+"""
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+
+from app.services import metrics
+from app.services.image_probe import probe_image, count_tiff_pages
+from app.services.preprocess_service import get_pool, preprocess_image
+from app.services.upload_service import sniff_image_format, SNIFF_BYTES
+
+# Pages per Vision request; batch_annotate_files allows at most 5 for inline files
+VISION_FILE_PAGES = 5
+
+
+def file_format(path):
+    """Get the sniffed format of a stored upload, or None if unrecognized"""
+    with open(path, 'rb') as f:
+        return sniff_image_format(f.read(SNIFF_BYTES))
+
+
+def is_multi_page(path):
+    """
+    Check whether an upload needs the multi-page OCR path
+
+    Args:
+        path (str): Path to the uploaded file
+
+    Returns:
+        bool: True for PDFs and for TIFFs with more than one page
+    """
+    image_format = file_format(path)
+    if image_format == 'pdf':
+        return True
+    if image_format == 'tiff':
+        try:
+            return probe_image(path).multi_frame
+        except ValueError:
+            return False
+    return False
+
+
+def merge_pages(page_results, language_hint='en'):
+    """
+    Merge per-page OCR results into one result
+
+    Args:
+        page_results (list): (extracted_text, structured_data) tuples, in page order
+        language_hint (str): Language hint used for the requests
+
+    Returns:
+        tuple: (extracted_text, structured_data) with every page in order
+    """
+    texts, pages, tables = [], [], []
+    for extracted_text, structured_data in page_results:
+        offset = len(pages)
+        texts.append(extracted_text)
+        pages.extend(structured_data.get('pages', []))
+        # Tables refer to their page by index, which now counts from the first page of the file
+        for table in structured_data.get('tables', []):
+            table['page'] = table.get('page', 0) + offset
+            tables.append(table)
+
+    structured_data = {
+        'pages': pages,
+        'tables': tables,
+        'language': language_hint
+    }
+    return '\n'.join(text.rstrip('\n') for text in texts), structured_data
+
+
+def _groups(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _too_many_pages(max_pages):
+    return ValueError(f"Document has too many pages. At most {max_pages} pages can be processed.")
+
+
+def _ocr_pdf_pages(app, content, pages, language_hint):
+    """OCR a group of PDF pages on a pool thread"""
+    with app.app_context():
+        from app.services.google_vision_service import detect_text_in_file
+        return detect_text_in_file(content, pages, language_hint)[1]
+
+
+def _ocr_pdf(app, executor, path, language_hint, max_pages):
+    # Every request carries the whole file, so it is read once and shared
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    # The first request (no page list means the first 5) also tells us how many pages there are
+    from app.services.google_vision_service import detect_text_in_file
+    total_pages, results = detect_text_in_file(content, [], language_hint)
+    if total_pages > max_pages:
+        raise _too_many_pages(max_pages)
+
+    futures = [
+        executor.submit(_ocr_pdf_pages, app, content, group, language_hint)
+        for group in _groups(list(range(VISION_FILE_PAGES + 1, total_pages + 1)), VISION_FILE_PAGES)
+    ]
+    for future in futures:
+        results.extend(future.result())
+    return results, len(content) * (1 + len(futures))
+
+
+def _ocr_tiff_pages(app, page_futures, language_hint):
+    """OCR a group of split TIFF pages on a pool thread once they are ready"""
+    with app.app_context():
+        from app.services.google_vision_service import detect_text_with_vision_batch
+
+        paths = [target_path for target_path, _ in page_futures]
+        try:
+            for _, future in page_futures:
+                future.result()
+            results = detect_text_with_vision_batch(paths, language_hint)
+        finally:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return [(extracted_text, structured_data) for extracted_text, structured_data, _ in results]
+
+
+def _ocr_tiff(app, executor, path, language_hint, max_pages):
+    page_count = count_tiff_pages(path, max_pages)
+    if page_count > max_pages:
+        raise _too_many_pages(max_pages)
+
+    # Split every page in the process pool; each task decodes only its own page
+    max_side = current_app.config.get('PREPROCESS_MAX_SIDE', 3508)
+    quality = current_app.config.get('PREPROCESS_QUALITY', 85)
+    pool = get_pool()
+    stem = os.path.splitext(path)[0]
+    page_futures = []
+    for index in range(page_count):
+        target_path = f"{stem}.page{index + 1}.ocr.jpg"
+        page_futures.append((target_path, pool.submit(preprocess_image, path, target_path, max_side, quality,
+                                                      frame=index)))
+
+    # Send each group of pages to Vision as soon as its pages are split
+    futures = [
+        executor.submit(_ocr_tiff_pages, app, group, language_hint)
+        for group in _groups(page_futures, VISION_FILE_PAGES)
+    ]
+    results = []
+    try:
+        for future in futures:
+            results.extend(future.result())
+    finally:
+        # After a failure, stop what hasn't started and remove the pages nobody will send
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        for target_path, page_future in page_futures:
+            if not page_future.cancel():
+                wait([page_future])
+            if os.path.exists(target_path):
+                os.remove(target_path)
+
+    # Every page was split, or a group would have failed
+    return results, sum(page_future.result() for _, page_future in page_futures)
+
+
+def detect_text_in_pages(path, language_hint='en'):
+    """
+    Run OCR on every page of a multi-page TIFF or PDF
+
+    Args:
+        path (str): Path to the uploaded file
+        language_hint (str): Language hint for OCR
+
+    Returns:
+        tuple: (extracted_text, structured_data, request_id, sent_bytes): the result, like
+            detect_text_with_vision, and the bytes sent to Vision for all the pages
+
+    Raises:
+        Exception: If the file has too many pages or any page fails
+    """
+    app = current_app._get_current_object()
+    max_pages = current_app.config.get('MAX_DOCUMENT_PAGES', 50)
+    max_workers = current_app.config.get('PAGE_MAX_WORKERS', 4)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pages') as executor:
+        if file_format(path) == 'pdf':
+            page_results, sent_bytes = _ocr_pdf(app, executor, path, language_hint, max_pages)
+        else:
+            page_results, sent_bytes = _ocr_tiff(app, executor, path, language_hint, max_pages)
+
+    metrics.counter('ocr_pages').inc(len(page_results))
+    metrics.histogram('multi_page_ocr_seconds').observe(time.time() - start_time)
+    current_app.logger.info(f"OCR finished for {len(page_results)} pages of {os.path.basename(path)}")
+
+    extracted_text, structured_data = merge_pages(page_results, language_hint)
+    return extracted_text, structured_data, str(uuid.uuid4()), sent_bytes
@@ -0,0 +1,96 @@
+"""
+Pagination Service - Keyset (cursor) pagination for the newest-first lists
+
+The documents and batches lists are ordered newest first. OFFSET pagination
+makes the database count every row and walk past all the earlier pages, so a
+late page of a long history costs as much as reading it all. Here a page
+starts from a cursor instead: the (created_at, id) of the row next to it. The
+query seeks straight to that point in the (user_id, created_at, id) index and
+reads one page, so every page costs the same as the first. There is no total
+count, so the lists link to the newer and older pages only.
+
+Cursors are opaque URL-safe strings; an invalid one is treated as no cursor.
+"""
+import base64
+from datetime import datetime
+
+from app import db
+
+
+class KeysetPage:
+    """One page of rows, with cursors for the pages either side of it"""
+
+    def __init__(self, items, has_prev, has_next):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = encode_cursor(items[0]) if has_prev and items else None
+        self.next_cursor = encode_cursor(items[-1]) if has_next and items else None
+
+
+def encode_cursor(row):
+    """
+    Encode the position of a row as a cursor
+
+    Args:
+        row: A Document or BatchProcess (anything with created_at and id)
+
+    Returns:
+        str: An opaque, URL-safe cursor
+    """
+    value = f"{row.created_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model):
+    """
+    Decode a cursor made by encode_cursor
+
+    Args:
+        cursor (str): The cursor
+        model: The model whose rows are being paged
+
+    Returns:
+        tuple: (created_at, id), or None if the cursor is missing or invalid
+    """
+    if not cursor:
+        return None
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = value.split('|', 1)
+        return datetime.fromisoformat(created_at), model.id.type.python_type(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(query, model, after=None, before=None, per_page=10):
+    """
+    Get one page of a query, newest first
+
+    Args:
+        query: The filtered query, without ordering
+        model: The model being queried; its created_at and id give the order
+        after (str): Cursor of the row just above the page (the older page)
+        before (str): Cursor of the row just below the page (the newer page)
+        per_page (int): Rows per page
+
+    Returns:
+        KeysetPage: The rows of the page and the cursors next to it
+    """
+    key = db.tuple_(model.created_at, model.id)
+    after_key = decode_cursor(after, model)
+    before_key = decode_cursor(before, model) if after_key is None else None
+
+    # One extra row tells whether there is another page in the same direction
+    if before_key is not None:
+        rows = query.filter(key > db.tuple_(*before_key)).order_by(
+            model.created_at.asc(), model.id.asc()
+        ).limit(per_page + 1).all()
+        if len(rows) > per_page:
+            return KeysetPage(rows[:per_page][::-1], has_prev=True, has_next=True)
+        # Fewer than a page of newer rows: show the first page, full, instead
+
+    if after_key is not None:
+        query = query.filter(key < db.tuple_(*after_key))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], has_prev=after_key is not None, has_next=len(rows) > per_page)
@@ -0,0 +1,124 @@
+"""
+Plan Cache - Keeps subscription plans in memory, keyed by plan name
+
+Plans are read on every upload (for the user's quota and file size limit) and
+on every plans page, but they almost never change. All plans are loaded with
+one query on first use and served from memory afterwards. Any commit that
+inserts, updates or deletes a Plan in this process (init_plans, an admin edit
+in flask shell) drops the cache; other processes pick the change up within
+PLAN_CACHE_TTL seconds.
+
+Cached plans are read-only snapshots, not ORM instances, so they can be shared
+between threads and never end up attached to a request's session.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# (loaded_at, {name: CachedPlan}) or None when the cache is empty
+_plans = None
+_plans_lock = threading.Lock()
+
+
+def _reset_cache():
+    """Give a forked child its own lock"""
+    global _plans_lock
+    _plans_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_cache)
+
+
+_snapshot_class = None
+
+
+def _snapshot(plan):
+    """Copy a Plan's column values into an immutable CachedPlan"""
+    global _snapshot_class
+    from app.models import Plan
+
+    if _snapshot_class is None:
+        fields = [column.key for column in Plan.__table__.columns]
+
+        class CachedPlan(namedtuple('CachedPlan', fields)):
+            """Read-only copy of a Plan row"""
+            __slots__ = ()
+            get_features = Plan.get_features
+
+            def __repr__(self):
+                return f'<Plan {self.name}>'
+
+        _snapshot_class = CachedPlan
+
+    return _snapshot_class(*[getattr(plan, field) for field in _snapshot_class._fields])
+
+
+def _load():
+    from app.models import Plan
+
+    plans = {}
+    for plan in Plan.query.order_by(Plan.id).all():
+        # Keep the first row when names repeat, as .first() did
+        plans.setdefault(plan.name, _snapshot(plan))
+    return plans
+
+
+def _get_plans():
+    global _plans
+    ttl = current_app.config.get('PLAN_CACHE_TTL', 60)
+    cached = _plans
+    if cached is None or time.monotonic() - cached[0] > ttl:
+        with _plans_lock:
+            cached = _plans
+            if cached is None or time.monotonic() - cached[0] > ttl:
+                cached = (time.monotonic(), _load())
+                _plans = cached
+    return cached[1]
+
+
+def get_plan(name, active_only=False):
+    """
+    Get a plan by name
+
+    Args:
+        name (str): Plan name, e.g. 'free', 'monthly', 'yearly' or 'enterprise'
+        active_only (bool): Return None for a plan that is not active
+
+    Returns:
+        CachedPlan: A read-only copy of the plan, or None if there is no such plan
+    """
+    plan = _get_plans().get(name)
+    if plan is None or (active_only and not plan.is_active):
+        return None
+    return plan
+
+
+def invalidate_plan_cache():
+    """Drop the cached plans so the next lookup reloads them"""
+    global _plans
+    _plans = None
+
+
+@event.listens_for(Session, 'before_flush')
+def _note_plan_changes(session, flush_context, instances):
+    from app.models import Plan
+
+    if any(isinstance(obj, Plan) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['plans_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('plans_changed', False):
+        invalidate_plan_cache()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_plan_changes(session):
+    session.info.pop('plans_changed', None)
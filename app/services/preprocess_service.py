@@ -0,0 +1,156 @@
+"""
+Preprocess Service - Shrinks uploaded images before they are sent for OCR
+
+Uploads can be up to 6200x6200 pixels and tens of megabytes, far more than
+OCR needs. Before OCR each image is downscaled to about 300 DPI on a letter or
+A4 page, converted to grayscale and re-encoded as JPEG. The work is CPU bound,
+so it runs in a process pool rather than on the batch worker threads.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+from app.services import metrics
+
+# One pool per process, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(max_pixels):
+    """Apply the app's decompression bomb limit in each pool process"""
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+def preprocess_image(source_path, target_path, max_side, quality, frame=None):
+    """
+    Downscale, grayscale and re-encode one image for OCR
+
+    Runs in a pool process, so it must not use the app or request context.
+
+    Args:
+        source_path (str): The uploaded image
+        target_path (str): Where to write the preprocessed JPEG
+        max_side (int): Longest side of the result, in pixels
+        quality (int): JPEG quality
+        frame (int): Page of a multi-page image to extract, 0-based. Only that page is
+            decoded, and the result is always written.
+
+    Returns:
+        int: Size of the preprocessed file in bytes, or None if it wasn't smaller than the
+            original (target_path is then not written)
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as img:
+        if frame is not None:
+            img.seek(frame)
+        # Let the JPEG decoder scale down while decoding, which is much faster
+        img.draft('L', (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # Flatten transparency onto white, as the page would be printed
+            img = img.convert('RGBA')
+            background = Image.new('RGBA', img.size, 'white')
+            img = Image.alpha_composite(background, img)
+        img = img.convert('L')
+
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        img.save(target_path, 'JPEG', quality=quality, optimize=True)
+
+    size = os.path.getsize(target_path)
+    if frame is None and size >= os.path.getsize(source_path):
+        os.remove(target_path)
+        return None
+    return size
+
+
+def _reset_pool():
+    """Drop the pool in a forked child; its processes belong to the parent"""
+    global _pool
+    _pool = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def get_pool():
+    """Get this process's preprocessing pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Spawn rather than fork: the worker process runs threads of its own
+                _pool = ProcessPoolExecutor(
+                    max_workers=current_app.config.get('PREPROCESS_WORKERS', 2),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(current_app.config['PAID_USER_MAX_RESOLUTION'] ** 2,)
+                )
+    return _pool
+
+
+def preprocess_documents(documents):
+    """
+    Preprocess the uploaded images of several documents in parallel
+
+    Sets preprocessed_size on each document; the caller commits.
+
+    Args:
+        documents (list): Documents whose stored_filename should be preprocessed
+
+    Returns:
+        dict: Path of the file to send for OCR, keyed by document ID. This is the
+            original upload when preprocessing is disabled, fails or doesn't help.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    paths = {document.id: os.path.join(upload_folder, document.stored_filename) for document in documents}
+    if not documents or not current_app.config.get('PREPROCESS_ENABLED', True):
+        return paths
+
+    max_side = current_app.config.get('PREPROCESS_MAX_SIDE', 3508)
+    quality = current_app.config.get('PREPROCESS_QUALITY', 85)
+
+    start_time = time.time()
+    pool = get_pool()
+    futures = {}
+    for document in documents:
+        target_path = os.path.join(upload_folder, f"{os.path.splitext(document.stored_filename)[0]}.ocr.jpg")
+        futures[document.id] = (target_path, pool.submit(preprocess_image, paths[document.id], target_path,
+                                                         max_side, quality))
+
+    for document in documents:
+        target_path, future = futures[document.id]
+        try:
+            size = future.result()
+        except Exception as e:
+            current_app.logger.warning(f"Preprocessing failed for document {document.id}, using original: {str(e)}")
+            size = None
+
+        if size is None:
+            document.preprocessed_size = document.file_size
+        else:
+            document.preprocessed_size = size
+            paths[document.id] = target_path
+            metrics.counter('preprocess_bytes_saved').inc(document.file_size - size)
+
+    metrics.histogram('preprocess_seconds').observe(time.time() - start_time)
+    return paths
+
+
+def cleanup_preprocessed(paths, documents):
+    """Remove preprocessed files once OCR no longer needs them"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for document in documents:
+        path = paths.get(document.id)
+        if path and path != os.path.join(upload_folder, document.stored_filename) and os.path.exists(path):
+            os.remove(path)
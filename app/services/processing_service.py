@@ -0,0 +1,499 @@
+"""
+Processing Service - Runs OCR and document generation for uploaded images
+
+These functions run inside background workers (see job_queue.py), never inside
+a web request, so they must not rely on `current_user` or the request context.
+"""
+import os
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from flask import current_app
+
+from app import db
+from app.models import Document, ApiUsage, BatchProcess
+from app.services.archive_service import batch_archive_name, append_to_archive, finalize_archive
+from app.services.document_service import generate_document_cached
+from app.services.events import publish_document_status, publish_batch_status
+from app.services.job_queue import job_handler
+from app.services.ocr_cache import get_cached_ocr, store_ocr
+from app.services.page_service import is_multi_page, detect_text_in_pages
+from app.services.preprocess_service import preprocess_documents, cleanup_preprocessed
+
+
+@job_handler('process_document')
+def process_document(document_id, update_batch=True):
+    """
+    Run OCR and document generation for a single document
+
+    Args:
+        document_id (int): ID of the document to process
+        update_batch (bool): Count the result against the document's batch. The batch
+            executor passes False and tallies results itself.
+
+    Returns:
+        str: Final status of the document, or None if it was not pending (or abandoned,
+            see claimable_documents)
+    """
+    document = Document.query.filter(Document.id == document_id, claimable_documents()).first()
+    if not document:
+        return None
+
+    # Update status to processing
+    document.status = 'processing'
+    document.updated_at = datetime.utcnow()
+    if document.batch_id:
+        BatchProcess.bump_version(document.batch_id)
+    db.session.commit()
+    publish_document_status(document)
+
+    try:
+        # Reuse the OCR result of an identical earlier upload if we have one
+        cached = get_cached_ocr(document.content_hash, document.language)
+        if cached:
+            ocr_text, structured_data = cached
+            request_id = str(uuid.uuid4())
+            api_type = 'ocr_cache'
+            processing_time = 0
+        elif is_multi_page(_upload_path(document)):
+            # Multi-page TIFF or PDF: every page is OCR'd, concurrently
+            start_time = time.time()
+            ocr_text, structured_data, request_id, sent_bytes = detect_text_in_pages(
+                _upload_path(document),
+                language_hint=document.language
+            )
+            processing_time = time.time() - start_time
+            document.preprocessed_size = sent_bytes
+
+            store_ocr(document.content_hash, document.language, ocr_text, structured_data)
+            api_type = 'google_vision'
+        else:
+            # Import here to avoid import errors if Google Vision isn't installed
+            from app.services.google_vision_service import detect_text_with_vision
+
+            # Shrink the image before it goes over the wire
+            file_paths = preprocess_documents([document])
+
+            # Process with Google Vision API for OCR
+            start_time = time.time()
+            try:
+                ocr_text, structured_data, request_id = detect_text_with_vision(
+                    file_paths[document.id],
+                    language_hint=document.language
+                )
+            finally:
+                cleanup_preprocessed(file_paths, [document])
+            processing_time = time.time() - start_time
+
+            store_ocr(document.content_hash, document.language, ocr_text, structured_data)
+            api_type = 'google_vision'
+
+        complete_document(document, ocr_text, structured_data, request_id, processing_time, api_type)
+
+    except Exception as e:
+        fail_document(document, str(e))
+
+    # Update batch process if part of a batch
+    if document.batch_id and update_batch:
+        record_batch_progress(document.batch_id, document.status)
+
+    return document.status
+
+
+def claimable_documents():
+    """
+    Filter for the documents a job may start processing
+
+    A job that was requeued because its worker died finds its documents still
+    'processing'. Once they have been left that way for longer than the job
+    visibility timeout they are taken over, so the document and its batch can
+    finish.
+
+    Returns:
+        The SQL condition
+    """
+    stale = datetime.utcnow() - timedelta(seconds=current_app.config.get('JOB_VISIBILITY_TIMEOUT', 600))
+    return db.or_(
+        Document.status == 'pending',
+        db.and_(Document.status == 'processing', Document.updated_at < stale)
+    )
+
+
+def _upload_path(document):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], document.stored_filename)
+
+
+def complete_document(document, ocr_text, structured_data, request_id, processing_time,
+                      api_type='google_vision'):
+    """
+    Generate the output file for a document whose OCR has finished
+
+    Args:
+        document (Document): The document being processed
+        ocr_text (str): Raw OCR text
+        structured_data (dict): Structured OCR data
+        request_id (str): OCR request ID
+        processing_time (float): Time spent on OCR, in seconds
+        api_type (str): Where the OCR result came from ('google_vision' or 'ocr_cache')
+    """
+    # Store structured data as a compact blob
+    document.set_structured_data(structured_data)
+    document.anthropic_request_id = request_id  # Kept for compatibility
+
+    # Generate the output document
+    output_filename = f"{uuid.uuid4().hex}.{document.file_type}"
+    output_path = os.path.join(current_app.config['UPLOAD_FOLDER'], output_filename)
+
+    # Render the document, or reuse an identical earlier render
+    success, error_message = generate_document_cached(
+        structured_data,
+        ocr_text,  # Also pass the OCR text as a fallback
+        document.file_type,
+        output_path
+    )
+
+    if success:
+        document.status = 'completed'
+        document.output_filename = output_filename
+
+        # Add the output to the batch archive now, so finalizing the batch is instant
+        if document.batch_id and document.batch.create_combined_output:
+            try:
+                append_to_archive(
+                    batch_archive_paths(document.batch_id)[0],
+                    output_path,
+                    batch_archive_name(document, document.batch.total_documents > 1)
+                )
+            except Exception as e:
+                current_app.logger.error(f"Error adding document {document.id} to batch archive: {str(e)}")
+    else:
+        document.status = 'failed'
+        document.error_message = error_message
+
+    # Record API usage
+    api_usage = ApiUsage(
+        user_id=document.user_id,
+        document_id=document.id,
+        api_type=api_type,
+        processing_time=processing_time
+    )
+    db.session.add(api_usage)
+    if document.batch_id:
+        BatchProcess.bump_version(document.batch_id)
+    db.session.commit()
+    publish_document_status(document)
+
+
+def fail_document(document, error_message):
+    """Mark a document as failed with the given error"""
+    document.status = 'failed'
+    document.error_message = error_message
+    if document.batch_id:
+        BatchProcess.bump_version(document.batch_id)
+    db.session.commit()
+    publish_document_status(document)
+
+
+@job_handler('process_batch')
+def process_batch(batch_id):
+    """
+    Process every pending (or abandoned) document in a batch concurrently
+
+    Pending documents are grouped into chunks that each go to Vision as one
+    batch_annotate_images call. Chunks and the per-document rendering that
+    follows them run on a bounded thread pool (OCR is dominated by the Vision
+    round trip, so threads overlap well). Results are tallied on this thread
+    as each document finishes, so the batch counters are only ever written
+    from one place.
+
+    Args:
+        batch_id (str): The batch ID
+    """
+    batch = BatchProcess.query.get(batch_id)
+    if not batch:
+        return
+
+    if batch.status == 'pending' and BatchProcess.start_processing(batch_id):
+        db.session.commit()
+        publish_batch_status(batch)
+
+    pending = db.session.query(Document.id, Document.file_size).filter(
+        Document.batch_id == batch_id,
+        claimable_documents()
+    ).order_by(Document.batch_order).all()
+    if not pending:
+        # Every document has finished; a rerun after a crash still needs the batch finalized
+        finalize_batch(batch_id)
+        return
+
+    chunks = _chunk_documents(
+        pending,
+        current_app.config.get('VISION_BATCH_SIZE', 16),
+        current_app.config.get('VISION_BATCH_MAX_BYTES', 8 * 1024 * 1024)
+    )
+
+    app = current_app._get_current_object()
+    max_workers = min(current_app.config.get('BATCH_MAX_WORKERS', 4), len(pending))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"batch-{batch_id[:8]}") as executor:
+        ocr_futures = {executor.submit(_ocr_chunk, app, chunk): chunk for chunk in chunks}
+        render_futures = {}
+
+        while ocr_futures or render_futures:
+            done, _ = wait(list(ocr_futures) + list(render_futures), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future in ocr_futures:
+                    chunk = ocr_futures.pop(future)
+                    try:
+                        ocr_results = future.result()
+                    except Exception as e:
+                        current_app.logger.error(f"Batch {batch_id} OCR error: {str(e)}")
+                        ocr_results = [(doc_id, e, 0) for doc_id in chunk]
+
+                    # Render each document as soon as its OCR result is back
+                    for doc_id, result, processing_time in ocr_results:
+                        render = executor.submit(_render_batch_document, app, doc_id, result, processing_time)
+                        render_futures[render] = doc_id
+                else:
+                    doc_id = render_futures.pop(future)
+                    try:
+                        document_status = future.result()
+                    except Exception as e:
+                        current_app.logger.error(f"Batch {batch_id} document {doc_id} error: {str(e)}")
+                        document_status = 'failed'
+
+                    if document_status:
+                        record_batch_progress(batch_id, document_status)
+
+
+def _chunk_documents(documents, max_count, max_bytes):
+    """Group (id, file_size) rows into lists of ids that fit one Vision batch request"""
+    chunks = []
+    current, current_bytes = [], 0
+    for doc_id, file_size in documents:
+        if current and (len(current) >= max_count or current_bytes + file_size > max_bytes):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(doc_id)
+        current_bytes += file_size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _ocr_chunk(app, document_ids):
+    """
+    Run OCR for a chunk of documents with one Vision batch request
+
+    Returns:
+        list: (document_id, result, processing_time) per document, where result is
+            an (ocr_text, structured_data, request_id, api_type) tuple or an Exception
+    """
+    with app.app_context():
+        try:
+            documents = Document.query.filter(
+                Document.id.in_(document_ids),
+                claimable_documents()
+            ).order_by(Document.batch_order).all()
+            if not documents:
+                return []
+
+            now = datetime.utcnow()
+            for document in documents:
+                document.status = 'processing'
+                document.updated_at = now
+            BatchProcess.bump_version(documents[0].batch_id)
+            db.session.commit()
+            for document in documents:
+                publish_document_status(document)
+
+            results = []
+
+            # Documents with a cached OCR result skip the Vision call
+            uncached = []
+            for document in documents:
+                cached = get_cached_ocr(document.content_hash, document.language)
+                if cached:
+                    ocr_text, structured_data = cached
+                    results.append((document.id, (ocr_text, structured_data, str(uuid.uuid4()), 'ocr_cache'), 0))
+                elif is_multi_page(_upload_path(document)):
+                    # Multi-page files can't go in an image batch; their pages are OCR'd on their own
+                    start_time = time.time()
+                    try:
+                        ocr_text, structured_data, request_id, sent_bytes = detect_text_in_pages(
+                            _upload_path(document),
+                            language_hint=document.language
+                        )
+                        document.preprocessed_size = sent_bytes
+                        db.session.commit()
+                        store_ocr(document.content_hash, document.language, ocr_text, structured_data)
+                        result = (ocr_text, structured_data, request_id, 'google_vision')
+                    except Exception as e:
+                        result = e
+                    results.append((document.id, result, time.time() - start_time))
+                else:
+                    uncached.append(document)
+
+            if uncached:
+                # Shrink the images in the process pool before they go over the wire
+                file_paths = preprocess_documents(uncached)
+                db.session.commit()
+
+                start_time = time.time()
+                try:
+                    # Import here to avoid import errors if Google Vision isn't installed
+                    from app.services.google_vision_service import detect_text_with_vision_batch
+
+                    vision_results = detect_text_with_vision_batch(
+                        [file_paths[document.id] for document in uncached],
+                        language_hint=uncached[0].language
+                    )
+                except Exception as e:
+                    vision_results = [e] * len(uncached)
+                finally:
+                    cleanup_preprocessed(file_paths, uncached)
+                processing_time = time.time() - start_time
+
+                for document, result in zip(uncached, vision_results):
+                    if not isinstance(result, Exception):
+                        ocr_text, structured_data, request_id = result
+                        store_ocr(document.content_hash, document.language, ocr_text, structured_data)
+                        result = (ocr_text, structured_data, request_id, 'google_vision')
+                    results.append((document.id, result, processing_time))
+
+            return results
+        finally:
+            db.session.remove()
+
+
+def _render_batch_document(app, document_id, ocr_result, processing_time):
+    """Generate the output file for one batch document on a pool thread"""
+    with app.app_context():
+        try:
+            document = Document.query.get(document_id)
+            if isinstance(ocr_result, Exception):
+                fail_document(document, str(ocr_result))
+            else:
+                ocr_text, structured_data, request_id, api_type = ocr_result
+                try:
+                    complete_document(document, ocr_text, structured_data, request_id, processing_time, api_type)
+                except Exception as e:
+                    db.session.rollback()
+                    fail_document(document, str(e))
+            return document.status
+        finally:
+            db.session.remove()
+
+
+def record_batch_progress(batch_id, document_status):
+    """
+    Count a finished document against its batch and finalize the batch when done
+
+    The counters are incremented in SQL, so documents finishing at the same time
+    never lose an update. Once every document is accounted for the batch is
+    finalized (see finalize_batch).
+
+    Args:
+        batch_id (str): The batch ID
+        document_status (str): Final status of the document ('completed' or 'failed')
+    """
+    counters = {'completed': BatchProcess.completed_documents, 'failed': BatchProcess.failed_documents}
+    counter = counters.get(document_status)
+    if counter is None:
+        return
+
+    updated = BatchProcess.query.filter_by(id=batch_id).update(
+        {counter: counter + 1, BatchProcess.version: BatchProcess.version + 1},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.rollback()
+        return
+
+    finalize_batch(batch_id)
+
+
+def finalize_batch(batch_id):
+    """
+    Finalize a batch whose documents have all finished, if nobody else is
+
+    The caller that moves the batch to finalizing (a compare-and-set on status)
+    is the only one that finalizes it, so the archive is written once. A batch
+    left finalizing for longer than the job visibility timeout, by a worker
+    that died, is claimed again; finishing the archive a second time is safe.
+    Commits the current transaction.
+
+    Args:
+        batch_id (str): The batch ID
+    """
+    stale = datetime.utcnow() - timedelta(seconds=current_app.config.get('JOB_VISIBILITY_TIMEOUT', 600))
+    claimed = BatchProcess.query.filter(
+        BatchProcess.id == batch_id,
+        db.or_(
+            db.and_(
+                BatchProcess.status.in_(('pending', 'processing')),
+                BatchProcess.completed_documents + BatchProcess.failed_documents >= BatchProcess.total_documents
+            ),
+            db.and_(BatchProcess.status == 'finalizing', BatchProcess.updated_at < stale)
+        )
+    ).update(
+        {BatchProcess.status: 'finalizing', BatchProcess.updated_at: datetime.utcnow(),
+         BatchProcess.version: BatchProcess.version + 1},
+        synchronize_session=False
+    )
+    db.session.commit()
+
+    batch = BatchProcess.query.get(batch_id)
+    if claimed:
+        # Write the central directory of the archive built up as documents completed
+        if batch.completed_documents > 0 and batch.create_combined_output:
+            finalize_batch_archive(batch)
+
+        batch.status = 'completed'
+        BatchProcess.bump_version(batch_id)
+        db.session.commit()
+
+    publish_batch_status(batch)
+
+
+def batch_archive_paths(batch_id):
+    """Get the paths of a batch's unfinished and finished archive"""
+    archive_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"batch_{batch_id}.zip")
+    return f"{archive_path}.part", archive_path
+
+
+def finalize_batch_archive(batch):
+    """
+    Finish a batch's incrementally built archive and record it as the batch output
+
+    If the archive is missing documents (e.g. an append failed), it is discarded
+    and downloads fall back to building the zip on the fly.
+
+    Args:
+        batch (BatchProcess): A batch whose documents have all finished
+    """
+    part_path, archive_path = batch_archive_paths(batch.id)
+    try:
+        if os.path.exists(part_path):
+            entries = finalize_archive(part_path, archive_path)
+        elif os.path.exists(archive_path):
+            # Finished by an earlier attempt that died before recording it
+            with zipfile.ZipFile(archive_path) as archive:
+                entries = len(archive.infolist())
+        else:
+            return
+    except Exception as e:
+        current_app.logger.error(f"Error finalizing batch archive {batch.id}: {str(e)}")
+        return
+
+    if entries == batch.completed_documents:
+        batch.output_filename = os.path.basename(archive_path)
+        BatchProcess.bump_version(batch.id)
+    else:
+        current_app.logger.warning(
+            f"Batch archive {batch.id} has {entries} of {batch.completed_documents} documents, discarding it"
+        )
+        os.remove(archive_path)
@@ -211,10 +211,10 @@ def create_subscription(user, plan_type, payment_method='card', include_fees=Tru
     Returns:
         dict: Subscription details including order ID and amount
     """
-    from app.models import Plan
+    from app.services.plan_cache import get_plan
 
-    # Get plan from database
-    plan = Plan.query.filter_by(name=plan_type, is_active=True).first()
+    # Get plan from the plan cache
+    plan = get_plan(plan_type, active_only=True)
     if not plan:
         raise ValueError(f"Invalid plan type: {plan_type}")
 
@@ -0,0 +1,164 @@
+"""
+Upload Service - Streams uploaded files to disk as the request body arrives
+
+Werkzeug normally buffers each uploaded file in memory (or an anonymous temp
+file) before the view sees it. UploadRequest instead writes every file part
+straight into UPLOAD_FOLDER in chunks, counting bytes and hashing as it goes.
+A file whose header is not an image or PDF, or that grows past the user's size
+limit, stops being written at once and the rest of its bytes are discarded.
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+
+# Bytes needed to recognize every accepted format
+SNIFF_BYTES = 12
+
+
+def sniff_image_format(header):
+    """
+    Identify an image or PDF format from the first bytes of a file
+
+    Args:
+        header (bytes): At least SNIFF_BYTES leading bytes of the file
+
+    Returns:
+        str: 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'webp' or 'pdf', or None if unrecognized
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header.startswith(b'BM'):
+        return 'bmp'
+    if header[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if header.startswith(b'%PDF-'):
+        return 'pdf'
+    return None
+
+
+class SpooledUpload:
+    """One uploaded file, written to a temporary file in the upload folder while it is received"""
+
+    def __init__(self, directory, max_size=None, error=None):
+        self._digest = hashlib.sha256()
+        self._header = b''
+        self.max_size = max_size
+        self.size = 0
+        self.image_format = None
+        self.error = error
+        self.kept = False
+
+        # A file rejected up front (e.g. by its extension) never touches the disk
+        self.path, self._file = None, None
+        if not error:
+            os.makedirs(directory, exist_ok=True)
+            fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.part')
+            self._file = os.fdopen(fd, 'w+b')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.error:
+            # Rejected: drain the rest of the part without storing it
+            return len(data)
+
+        if self.max_size and self.size > self.max_size:
+            self._reject(f'File too large. Maximum size is {self.max_size / 1024 / 1024:.1f} MB')
+            return len(data)
+
+        if len(self._header) < SNIFF_BYTES:
+            self._header += data[:SNIFF_BYTES - len(self._header)]
+            if len(self._header) >= SNIFF_BYTES and not self._check_header():
+                return len(data)
+
+        self._digest.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def _check_header(self):
+        self.image_format = sniff_image_format(self._header)
+        if self.image_format is None:
+            self._reject('Invalid image: unrecognized file format')
+            return False
+        return True
+
+    def _reject(self, error):
+        self.error = error
+        self._discard()
+
+    def _is_open(self):
+        return self._file is not None and not self._file.closed
+
+    def _discard(self):
+        if self._is_open():
+            self._file.close()
+        if self.path and not self.kept and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def check(self):
+        """
+        Finish validating the file once it has been fully received
+
+        Returns:
+            str: Why the file was rejected, or None if it is acceptable
+        """
+        if not self.error and self.image_format is None:
+            self._check_header()
+        return self.error
+
+    def hexdigest(self):
+        """SHA-256 of the file contents"""
+        return self._digest.hexdigest()
+
+    def keep(self, path):
+        """Move the received file to its permanent path"""
+        self._file.close()
+        os.replace(self.path, path)
+        self.path = path
+        self.kept = True
+
+    # File-like interface used by werkzeug and FileStorage
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence) if self._is_open() else 0
+
+    def tell(self):
+        return self._file.tell() if self._is_open() else self.size
+
+    def read(self, size=-1):
+        return self._file.read(size) if self._is_open() else b''
+
+    def readline(self, size=-1):
+        return self._file.readline(size) if self._is_open() else b''
+
+    def flush(self):
+        if self._is_open():
+            self._file.flush()
+
+    def close(self):
+        # Called when the request ends; anything not kept is removed
+        self._discard()
+
+
+class UploadRequest(Request):
+    """Request class that spools uploaded files to disk with a per-file size limit"""
+
+    # Per-file limit in bytes; the upload view sets it from the user's plan
+    max_file_size = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        error = None
+        extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else None
+        if filename and extension not in current_app.config['ALLOWED_EXTENSIONS']:
+            error = 'Invalid file type'
+        elif self.max_file_size and content_length and content_length > self.max_file_size:
+            error = f'File too large. Maximum size is {self.max_file_size / 1024 / 1024:.1f} MB'
+
+        return SpooledUpload(current_app.config['UPLOAD_FOLDER'], self.max_file_size, error)
@@ -0,0 +1,127 @@
+"""
+Benchmark for the dashboard and list pages: queries issued and bytes fetched.
+
+Seeds a throwaway SQLite database with one user who owns many documents (with
+large OCR data and error messages) and batches, then requests each page with
+the test client and reports how many SQL statements ran and how many bytes
+their result rows carried.
+
+Usage:
+    python bench_dashboard.py
+    python bench_dashboard.py --documents 2000 --batch-size 10
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.config import TestingConfig
+
+
+def seed(app, n_documents, batch_size):
+    """Create one user with n_documents documents, grouped into batches of batch_size"""
+    from app.models import User, Document, BatchProcess
+
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com', username='bench', password='bench')
+        db.session.add(user)
+        db.session.commit()
+
+        heavy_data = {'pages': [{'blocks': [{'paragraphs': [{'text': 'x' * 200}] * 50}] * 20}]}
+        heavy_error = 'Traceback (most recent call last):\n' + '  File "worker.py", line 1\n' * 2000
+        now = datetime.utcnow()
+        batch = None
+
+        for i in range(n_documents):
+            if i % batch_size == 0:
+                batch = BatchProcess(id=f"{i:08d}-0000-0000-0000-000000000000", user_id=user.id,
+                                     total_documents=batch_size, completed_documents=batch_size - 1,
+                                     failed_documents=1, output_format='docx', status='completed',
+                                     created_at=now - timedelta(minutes=i))
+                db.session.add(batch)
+
+            failed = i % batch_size == 0
+            document = Document(user_id=user.id, original_filename=f"scan_{i}.png",
+                                stored_filename=f"{i}.png", output_filename=None if failed else f"{i}.docx",
+                                file_type='docx', file_size=1024 * 1024, status='failed' if failed else 'completed',
+                                error_message=heavy_error if failed else None, batch_id=batch.id,
+                                batch_order=i % batch_size, created_at=now - timedelta(minutes=i))
+            if hasattr(document, 'set_structured_data'):
+                document.set_structured_data(heavy_data)
+            db.session.add(document)
+
+        db.session.commit()
+        return user.id, batch.id
+
+
+def measure(app, client, url):
+    """Request a URL and return (status code, queries, bytes fetched, seconds)"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'after_cursor_execute', record)
+    try:
+        start = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, 'after_cursor_execute', record)
+
+    # Replay the SELECTs to total up the size of every value they returned
+    fetched = 0
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute(statement, parameters)
+            for row in cursor.fetchall():
+                fetched += sum(len(value) if isinstance(value, (str, bytes)) else 8
+                               for value in row if value is not None)
+    finally:
+        raw.close()
+
+    return response.status_code, len(statements), fetched, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=10)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'bench.sqlite3')
+        SESSION_COOKIE_SECURE = False
+        GOOGLE_VISION_KEY = None
+
+    app = create_app(BenchConfig)
+    user_id, batch_id = seed(app, args.documents, args.batch_size)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    print(f"{args.documents} documents in batches of {args.batch_size}")
+    print(f"{'page':<40} {'status':>6} {'queries':>8} {'bytes':>12} {'ms':>8}")
+    for url in ('/dashboard', '/documents', '/documents?show_batches=true',
+                f"/process/batch/{batch_id}", f"/batch/status/{batch_id}"):
+        status, queries, fetched, elapsed = measure(app, client, url)
+        print(f"{url[:40]:<40} {status:>6} {queries:>8} {fetched:>12,} {elapsed * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Benchmark for the Word and PDF generators on large, table-heavy OCR data.
+
+Builds synthetic structured data shaped like the Google Vision output and
+times generate_word_document / generate_pdf_document on it, next to the
+generators they replaced (kept below as reference_generate_word_document and
+reference_generate_pdf_document), which scanned every table with
+pages.index() / blocks.index() for each table block.
+
+Usage:
+    python bench_render.py                 # 50 pages, 20 blocks per page
+    python bench_render.py --pages 100 --blocks 40 --repeat 3
+"""
+import argparse
+import copy
+import os
+import tempfile
+import time
+
+from app.services.document_service import generate_word_document, generate_pdf_document
+
+
+def reference_generate_word_document(structured_data, ocr_text, output_path):
+    """The previous Word generator, which found each table with pages.index() and blocks.index()"""
+    try:
+        from docx import Document
+        from docx.shared import Pt, Inches
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+        doc = Document()
+
+        # If structured data is missing or empty, use raw OCR text as fallback
+        if not structured_data or not structured_data.get('pages'):
+            paragraph = doc.add_paragraph(ocr_text)
+            doc.save(output_path)
+            return True, None
+
+        # Process each page
+        for page in structured_data.get('pages', []):
+            # Sort blocks by vertical position (top to bottom)
+            blocks = page.get('blocks', [])
+            if not blocks:
+                continue
+
+            # Sort blocks by vertical position for proper reading order
+            sorted_blocks = sorted(blocks, key=lambda b: min(v[1] for v in b.get('bounding_box', [(0, 0)])))
+
+            for block in sorted_blocks:
+                if block.get('type') == 'table':
+                    # Create a table in Word
+                    table_data = next((t for t in structured_data.get('tables', [])
+                                       if t.get('page') == structured_data.get('pages').index(page) and
+                                       t.get('block') == blocks.index(block)), None)
+
+                    if table_data and table_data.get('rows'):
+                        rows = table_data.get('rows', [])
+                        if rows:
+                            # Determine the max columns in any row
+                            max_cols = max(len(row) for row in rows)
+                            table = doc.add_table(rows=len(rows), cols=max_cols)
+                            table.style = 'Table Grid'
+
+                            for i, row in enumerate(rows):
+                                for j, cell_text in enumerate(row):
+                                    if j < len(table.rows[i].cells):
+                                        table.rows[i].cells[j].text = cell_text
+
+                            # Add spacing after table
+                            doc.add_paragraph()
+                else:
+                    # Process text block
+                    for paragraph in block.get('paragraphs', []):
+                        p = doc.add_paragraph()
+
+                        # Get text
+                        text = paragraph.get('text', '')
+                        if not text.strip():
+                            continue
+
+                        # Detect if paragraph is a heading (simplified heuristic)
+                        if len(text) < 100 and (text.strip().endswith(':') or text.isupper() or
+                                                any(text.startswith(h) for h in ["Chapter ", "Section "])):
+                            p.style = 'Heading 2'
+                            p.add_run(text)
+                        else:
+                            # Add text with potential formatting
+                            for word in paragraph.get('words', []):
+                                word_text = word.get('text', '')
+                                run = p.add_run(word_text + ' ')
+
+                                # Apply basic formatting if detected
+                                # This is very simple detection based on common patterns
+                                if word_text.isupper() and len(word_text) > 1:
+                                    run.bold = True
+
+                                # Check for likely emphasis patterns
+                                if word_text.startswith('*') and word_text.endswith('*'):
+                                    run.italic = True
+
+                                # Check for likely underline patterns
+                                if word_text.startswith('_') and word_text.endswith('_'):
+                                    run.underline = True
+
+        # Save the document
+        doc.save(output_path)
+        return True, None
+
+    except ImportError:
+        # Handle missing python-docx library
+        return False, "python-docx library is required but not installed. Install it with: pip install python-docx"
+    except Exception as e:
+        return False, f"Error generating Word document: {str(e)}"
+
+
+def reference_generate_pdf_document(structured_data, ocr_text, output_path):
+    """The previous PDF generator, with the same lookups (it also sorts each page's blocks in place)"""
+    try:
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+        from reportlab.lib.styles import getSampleStyleSheet
+
+        doc = SimpleDocTemplate(output_path, pagesize=letter)
+        styles = getSampleStyleSheet()
+        elements = []
+
+        # If structured data is missing or empty, use raw OCR text as fallback
+        if not structured_data or not structured_data.get('pages'):
+            elements.append(Paragraph(ocr_text, styles['Normal']))
+            doc.build(elements)
+            return True, None
+
+        # Process each page
+        for page in structured_data.get('pages', []):
+            # Sort blocks by vertical position
+            blocks = page.get('blocks', [])
+            blocks.sort(key=lambda b: min(v[1] for v in b.get('bounding_box', [(0, 0)])))
+
+            for block in blocks:
+                if block.get('type') == 'table':
+                    # Create a table in PDF
+                    table_data = next((t for t in structured_data.get('tables', [])
+                                       if t.get('page') == structured_data.get('pages').index(page) and
+                                       t.get('block') == blocks.index(block)),
+                                      None)
+
+                    if table_data and table_data.get('rows'):
+                        t = Table(table_data.get('rows'))
+                        elements.append(t)
+                        elements.append(Spacer(1, 12))
+                else:
+                    # Process text block
+                    for paragraph in block.get('paragraphs', []):
+                        text = paragraph.get('text', '')
+                        if text.strip():
+                            # Apply appropriate style
+                            if len(text) < 100 and text.strip().endswith(':'):
+                                p = Paragraph(text, styles['Heading2'])
+                            else:
+                                p = Paragraph(text, styles['Normal'])
+
+                            elements.append(p)
+                            elements.append(Spacer(1, 6))
+
+        # Build the PDF
+        doc.build(elements)
+        return True, None
+    except Exception as e:
+        return False, f"Error generating PDF document: {str(e)}"
+
+
+def build_structured_data(pages, blocks_per_page, rows=6, cols=4):
+    """Build structured data where every other block is a table"""
+    pages_data = []
+    tables = []
+
+    for page_idx in range(pages):
+        blocks = []
+        for block_idx in range(blocks_per_page):
+            top = block_idx * 50
+            is_table = block_idx % 2 == 1
+
+            paragraphs = []
+            for row in range(rows if is_table else 2):
+                for col in range(cols if is_table else 1):
+                    x, y = col * 120, top + row * 8
+                    box = [(x, y), (x + 100, y), (x + 100, y + 6), (x, y + 6)]
+                    text = f"p{page_idx} b{block_idx} r{row} c{col}"
+                    paragraphs.append({
+                        'text': text,
+                        'words': [{'text': word, 'confidence': 0.9, 'bounding_box': box} for word in text.split()],
+                        'bounding_box': box
+                    })
+
+            blocks.append({
+                'type': 'table' if is_table else 'text',
+                'paragraphs': paragraphs,
+                'bounding_box': [(0, top), (500, top), (500, top + 48), (0, top + 48)]
+            })
+
+            if is_table:
+                tables.append({
+                    'rows': [[f"r{row} c{col}" for col in range(cols)] for row in range(rows)],
+                    'width': 500,
+                    'height': 48,
+                    'page': page_idx,
+                    'block': block_idx
+                })
+
+        # Store blocks out of reading order, as Vision sometimes does
+        blocks.reverse()
+        for table in tables:
+            if table['page'] == page_idx:
+                table['block'] = blocks_per_page - 1 - table['block']
+
+        pages_data.append({'width': 600, 'height': blocks_per_page * 50, 'blocks': blocks})
+
+    return {'pages': pages_data, 'tables': tables, 'language': 'en'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--blocks', type=int, default=20, help='blocks per page, half of them tables')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    structured_data = build_structured_data(args.pages, args.blocks)
+    print(f"{args.pages} pages, {args.blocks} blocks per page, {len(structured_data['tables'])} tables")
+
+    generators = (
+        ('docx reference', 'docx', reference_generate_word_document),
+        ('docx', 'docx', generate_word_document),
+        ('pdf reference', 'pdf', reference_generate_pdf_document),
+        ('pdf', 'pdf', generate_pdf_document),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, extension, generator in generators:
+            timings = []
+            for _ in range(args.repeat):
+                output_path = os.path.join(tmp, f"bench.{extension}")
+                # The reference PDF generator reorders the blocks it is given
+                data = copy.deepcopy(structured_data)
+                start = time.perf_counter()
+                success, error_message = generator(data, '', output_path)
+                timings.append(time.perf_counter() - start)
+                if not success:
+                    raise SystemExit(f"{name} generation failed: {error_message}")
+            print(f"{name}: best {min(timings):.3f}s, mean {sum(timings) / len(timings):.3f}s")
+
+
+if __name__ == '__main__':
+    main()
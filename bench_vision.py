@@ -0,0 +1,140 @@
+"""
+Benchmark for converting Vision responses into structured data.
+
+Times parse_annotation on recorded Vision responses and checks that it gives
+the same result as the straightforward converter it replaced (kept below as
+reference_parse_annotation), which walked the proto-plus wrappers.
+
+Recorded responses are JSON files as returned by the Vision REST API or
+`gcloud ml vision detect-document --format=json`: a single response, or an
+object with a "responses" list. Without files, a dense synthetic page is used.
+
+Usage:
+    python bench_vision.py                         # synthetic, 3000 words per page
+    python bench_vision.py --words 8000 --repeat 5
+    python bench_vision.py responses/*.json
+"""
+import argparse
+import json
+import time
+
+from google.cloud import vision_v1 as vision
+
+from app.services.google_vision_service import parse_annotation, extract_tables_from_blocks
+
+
+def reference_parse_annotation(annotation, language_hint='en'):
+    """The previous converter, which walked the proto-plus wrappers symbol by symbol"""
+    pages_data = []
+    for page in annotation.pages:
+        page_info = {'width': page.width, 'height': page.height, 'blocks': []}
+        for block in page.blocks:
+            block_info = {
+                'type': 'text' if block.block_type == 1 else 'table',
+                'paragraphs': [],
+                'bounding_box': [(vertex.x, vertex.y) for vertex in block.bounding_box.vertices]
+            }
+            for paragraph in block.paragraphs:
+                para_info = {
+                    'text': '',
+                    'words': [],
+                    'bounding_box': [(vertex.x, vertex.y) for vertex in paragraph.bounding_box.vertices]
+                }
+                for word in paragraph.words:
+                    word_text = ''.join([symbol.text for symbol in word.symbols])
+                    word_info = {
+                        'text': word_text,
+                        'confidence': word.confidence,
+                        'bounding_box': [(vertex.x, vertex.y) for vertex in word.bounding_box.vertices]
+                    }
+                    for symbol in word.symbols:
+                        if symbol.property and symbol.property.detected_break:
+                            break_type = symbol.property.detected_break.type
+                            if break_type in [1, 2, 3]:
+                                word_info['break_after'] = break_type
+                        if symbol.property and symbol.property.detected_languages:
+                            word_info['language'] = symbol.property.detected_languages[0].language_code
+                    para_info['words'].append(word_info)
+                    para_info['text'] += word_text + ' '
+                para_info['text'] = para_info['text'].strip()
+                block_info['paragraphs'].append(para_info)
+            page_info['blocks'].append(block_info)
+        pages_data.append(page_info)
+
+    tables = extract_tables_from_blocks(pages_data)
+    return annotation.text, {'pages': pages_data, 'tables': tables, 'language': language_hint}
+
+
+def _poly(x, y, width, height):
+    return {'vertices': [{'x': x, 'y': y}, {'x': x + width, 'y': y},
+                         {'x': x + width, 'y': y + height}, {'x': x, 'y': y + height}]}
+
+
+def build_annotation(words, words_per_line=12, lines_per_paragraph=4):
+    """Build a one-page TextAnnotation with the given number of words, laid out in lines"""
+    paragraphs = []
+    line_words = []
+    for index in range(words):
+        line, column = divmod(index, words_per_line)
+        text = f"word{index}"
+        symbols = [{'text': char} for char in text]
+        symbols[0]['property'] = {'detected_languages': [{'language_code': 'en', 'confidence': 0.99}]}
+        symbols[-1]['property'] = {'detected_break': {'type': 3 if column == words_per_line - 1 else 1}}
+        line_words.append({
+            'confidence': 0.97,
+            'bounding_box': _poly(column * 80, line * 20, 70, 14),
+            'symbols': symbols
+        })
+        if len(line_words) == words_per_line * lines_per_paragraph or index == words - 1:
+            top = line * 20 - (lines_per_paragraph - 1) * 20
+            paragraphs.append({'bounding_box': _poly(0, max(top, 0), 950, 80), 'words': line_words})
+            line_words = []
+
+    blocks = [
+        {'block_type': 1, 'bounding_box': _poly(0, i * 100, 950, 80), 'paragraphs': paragraphs[i:i + 3]}
+        for i in range(0, len(paragraphs), 3)
+    ]
+    page = {'width': 1000, 'height': (words // words_per_line + 1) * 20, 'blocks': blocks}
+    return vision.TextAnnotation(pages=[page], text=' '.join(f"word{i}" for i in range(words)))
+
+
+def load_annotations(paths):
+    """Load the full_text_annotation of every response in the given JSON files"""
+    annotations = []
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        for response in data.get('responses', [data]):
+            parsed = vision.AnnotateImageResponse.from_json(json.dumps(response), ignore_unknown_fields=True)
+            annotations.append(parsed.full_text_annotation)
+    return annotations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('responses', nargs='*', help='recorded Vision response JSON files')
+    parser.add_argument('--words', type=int, default=3000, help='words on the synthetic page')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    annotations = load_annotations(args.responses) if args.responses else [build_annotation(args.words)]
+    word_count = sum(len(paragraph.words) for annotation in annotations for page in annotation.pages
+                     for block in page.blocks for paragraph in block.paragraphs)
+    print(f"{len(annotations)} responses, {word_count} words")
+
+    for annotation in annotations:
+        if parse_annotation(annotation) != reference_parse_annotation(annotation):
+            raise SystemExit("parse_annotation output differs from the reference converter")
+
+    for name, converter in (('reference', reference_parse_annotation), ('parse_annotation', parse_annotation)):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for annotation in annotations:
+                converter(annotation)
+            timings.append(time.perf_counter() - start)
+        print(f"{name}: best {min(timings) * 1000:.1f}ms, mean {sum(timings) / len(timings) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
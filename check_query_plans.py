@@ -0,0 +1,166 @@
+"""
+Query plan check for the hot query paths.
+
+Seeds a throwaway SQLite database with a few users who own documents, batches,
+payments and API usage rows, requests the dashboard, the documents and
+batches lists (first, older and newer pages, and the infinite-scroll feed),
+batch status and billing pages with the test client, and runs the Stripe
+webhook's subscription lookup. Every SELECT they issue is replayed with
+EXPLAIN QUERY PLAN; the check fails (exit status 1) if any of them scans a
+whole table or sorts rows that an index should already return in order.
+
+Usage:
+    python check_query_plans.py
+    python check_query_plans.py --verbose     # print every plan
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+
+from app import create_app, db
+from app.config import TestingConfig
+
+# Tables that grow with usage; small lookup tables (plans) may be scanned
+CHECKED_TABLES = ('users', 'documents', 'batch_processes', 'payments', 'api_usage')
+
+
+def seed(app, n_users=3, n_batches=20, batch_size=5):
+    """Create users that each own batches of documents, payments and API usage rows"""
+    from app.models import User, Document, BatchProcess, Payment, ApiUsage
+
+    with app.app_context():
+        db.create_all()
+        now = datetime.utcnow()
+        batch_id = None
+        for u in range(n_users):
+            user = User(email=f"user{u}@example.com", username=f"user{u}", password='check')
+            user.subscription_id = f"sub_{u}"
+            db.session.add(user)
+            db.session.flush()
+
+            for b in range(n_batches):
+                batch_id = f"{u:04d}{b:04d}-0000-0000-0000-000000000000"
+                created_at = now - timedelta(hours=b)
+                db.session.add(BatchProcess(id=batch_id, user_id=user.id, total_documents=batch_size,
+                                            completed_documents=batch_size, failed_documents=0,
+                                            output_format='docx', status='completed', created_at=created_at))
+                for d in range(batch_size):
+                    document = Document(user_id=user.id, original_filename=f"scan_{d}.png",
+                                        stored_filename=f"{batch_id}_{d}.png", output_filename=f"{batch_id}_{d}.docx",
+                                        file_type='docx', file_size=1024, status='completed',
+                                        batch_id=batch_id, batch_order=d, created_at=created_at)
+                    db.session.add(document)
+                    db.session.flush()
+                    db.session.add(ApiUsage(user_id=user.id, document_id=document.id, api_type='google_vision',
+                                            created_at=created_at))
+
+                db.session.add(Payment(user_id=user.id, stripe_payment_id=f"pi_{batch_id}", amount=10,
+                                       status='succeeded', payment_method='card', created_at=created_at))
+
+        db.session.commit()
+
+        # Let the planner see realistic table sizes
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        return user.id, batch_id
+
+
+def capture(app, action):
+    """Run action() and return the SELECT statements it issued, with their parameters"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'after_cursor_execute', record)
+    try:
+        action()
+    finally:
+        event.remove(engine, 'after_cursor_execute', record)
+    return statements
+
+
+def plan_problems(plan):
+    """Find full scans and sorts of checked tables in an EXPLAIN QUERY PLAN result"""
+    problems = []
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r'SCAN (\w+)', detail)
+        if match and match.group(1) in CHECKED_TABLES and 'USING' not in detail:
+            problems.append(detail)
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            problems.append(detail)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true', help='print the plan of every query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class CheckConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'check.sqlite3')
+            UPLOAD_FOLDER = os.path.join(tmp, 'uploads')
+            JOB_QUEUE_PATH = os.path.join(tmp, 'jobs.sqlite3')
+
+        app = create_app(CheckConfig)
+        user_id, batch_id = seed(app)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+        def webhook_lookup():
+            from app.models import User
+            with app.app_context():
+                User.query.filter_by(subscription_id='sub_1').first()
+
+        # Cursors into the middle of the lists, for the older, newer and feed pages
+        from app.models import Document, BatchProcess
+        from app.services.pagination import encode_cursor
+        with app.app_context():
+            document_cursor = encode_cursor(Document.query.filter_by(user_id=user_id).order_by(Document.id).first())
+            batch_cursor = encode_cursor(BatchProcess.query.filter_by(user_id=user_id).order_by(
+                BatchProcess.created_at).first())
+
+        paths = [(url, lambda url=url: client.get(url)) for url in (
+            '/dashboard', '/documents', f'/documents?after={document_cursor}', f'/documents?before={document_cursor}',
+            f'/documents/feed?after={document_cursor}', '/documents?show_batches=true',
+            f'/documents?show_batches=true&after={batch_cursor}', f'/documents?show_batches=true&before={batch_cursor}',
+            f'/documents/feed?show_batches=true&after={batch_cursor}',
+            f'/batch/status/{batch_id}', f'/process/batch/{batch_id}', '/payment/billing-history',
+        )]
+        paths.append(('webhook: user by subscription_id', webhook_lookup))
+
+        failures = 0
+        with app.app_context():
+            for name, action in paths:
+                for statement, parameters in capture(app, action):
+                    plan = db.session.connection().exec_driver_sql(
+                        'EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                    problems = plan_problems(plan)
+                    if args.verbose or problems:
+                        print(f"{name}: {' '.join(statement.split())[:160]}")
+                        for row in plan:
+                            print(f"    {row[-1]}")
+                    if problems:
+                        failures += 1
+                        print(f"    FAIL: {'; '.join(problems)}")
+
+        if failures:
+            print(f"{failures} queries fall back to full scans or sorts")
+            sys.exit(1)
+        print("All hot-path queries use indexes")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ The plans are tailored for both international and Indian users.
 
 from app import create_app, db
 from app.models import Plan
+from app.services.plan_cache import invalidate_plan_cache
 import json
 
 def initialize_revised_plans():
@@ -134,6 +135,8 @@ def initialize_revised_plans():
 
         # Commit changes
         db.session.commit()
+        # The commit already dropped this process's plan cache; other processes reload within PLAN_CACHE_TTL
+        invalidate_plan_cache()
         print("All plans have been initialized successfully!")
 
 # if __name__ == '__main__':
@@ -0,0 +1,138 @@
+"""Move structured OCR data into document_data and add the new document and batch columns
+
+Revision ID: 2c7e9f0a4b61
+Revises:
+Create Date: 2026-10-18 11:00:00
+
+"""
+import json
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.services.ocr_storage import pack, unpack
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7e9f0a4b61'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# (table, column) for the columns added to existing tables
+NEW_COLUMNS = [
+    ('documents', sa.Column('content_hash', sa.String(length=64), nullable=True)),
+    ('documents', sa.Column('preprocessed_size', sa.Integer(), nullable=True)),
+    ('batch_processes', sa.Column('version', sa.Integer(), nullable=False, server_default='0')),
+]
+
+# Rows copied per round trip while moving structured data
+COPY_BATCH_SIZE = 500
+
+documents = sa.table(
+    'documents',
+    sa.column('id', sa.Integer),
+    sa.column('structured_data', sa.Text),
+)
+
+document_data = sa.table(
+    'document_data',
+    sa.column('document_id', sa.Integer),
+    sa.column('structured_data', sa.LargeBinary),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+# Databases created with db.create_all() already have the current schema, so every step checks first
+def _tables():
+    return sa.inspect(op.get_bind()).get_table_names()
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _batches(query):
+    """Run a query ordered by document id in batches, resuming after the last id seen"""
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(query(last_id).limit(COPY_BATCH_SIZE)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _copy_to_document_data():
+    """Pack every document's JSON structured_data into document_data"""
+    bind = op.get_bind()
+    copied = set(bind.execute(sa.select(document_data.c.document_id)).scalars())
+
+    def query(last_id):
+        return sa.select(documents.c.id, documents.c.structured_data).where(
+            documents.c.structured_data.isnot(None), documents.c.id > last_id
+        ).order_by(documents.c.id)
+
+    for rows in _batches(query):
+        values = []
+        for document_id, structured_data in rows:
+            if document_id in copied:
+                continue
+            try:
+                data = json.loads(structured_data)
+            except ValueError:
+                # The app could never read these either; there is nothing to keep
+                print(f"Skipping unreadable structured_data of document {document_id}")
+                continue
+            values.append({'document_id': document_id, 'structured_data': pack(data),
+                           'created_at': datetime.utcnow()})
+        if values:
+            bind.execute(document_data.insert(), values)
+
+
+def _copy_to_documents():
+    """Write every document_data blob back to documents.structured_data as JSON"""
+    bind = op.get_bind()
+
+    def query(last_id):
+        return sa.select(document_data.c.document_id, document_data.c.structured_data).where(
+            document_data.c.structured_data.isnot(None), document_data.c.document_id > last_id
+        ).order_by(document_data.c.document_id)
+
+    for rows in _batches(query):
+        for document_id, blob in rows:
+            bind.execute(documents.update().where(documents.c.id == document_id).values(
+                structured_data=json.dumps(unpack(blob))))
+
+
+def upgrade():
+    for table, column in NEW_COLUMNS:
+        if column.name not in _columns(table):
+            op.add_column(table, column)
+
+    if 'document_data' not in _tables():
+        op.create_table(
+            'document_data',
+            sa.Column('document_id', sa.Integer(), sa.ForeignKey('documents.id'), primary_key=True),
+            sa.Column('structured_data', sa.LargeBinary(length=(2 ** 32) - 1), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+
+    # Move the data over before the column goes
+    if 'structured_data' in _columns('documents'):
+        _copy_to_document_data()
+        with op.batch_alter_table('documents') as batch_op:
+            batch_op.drop_column('structured_data')
+
+
+def downgrade():
+    for table, column in reversed(NEW_COLUMNS):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(column.name)
+
+    with op.batch_alter_table('documents') as batch_op:
+        batch_op.add_column(sa.Column('structured_data', sa.Text(), nullable=True))
+    _copy_to_documents()
+    op.drop_table('document_data')
@@ -0,0 +1,44 @@
+"""Add indexes for the dashboard, list, batch, billing and webhook queries
+
+Revision ID: 3f1c2a7d9b10
+Revises: 2c7e9f0a4b61
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b10'
+down_revision = '2c7e9f0a4b61'
+branch_labels = None
+depends_on = None
+
+# Databases created with db.create_all() after this change already have the indexes
+INDEXES = [
+    ('ix_users_subscription_id', 'users', ['subscription_id']),
+    ('ix_documents_user_id_created_at', 'documents', ['user_id', sa.text('created_at DESC')]),
+    ('ix_documents_batch_id_batch_order', 'documents', ['batch_id', 'batch_order']),
+    ('ix_batch_processes_user_id_created_at', 'batch_processes', ['user_id', sa.text('created_at DESC')]),
+    ('ix_payments_user_id_created_at', 'payments', ['user_id', sa.text('created_at DESC')]),
+    ('ix_payments_stripe_payment_id', 'payments', ['stripe_payment_id']),
+    ('ix_api_usage_user_id_created_at', 'api_usage', ['user_id', sa.text('created_at DESC')]),
+]
+
+
+# IF [NOT] EXISTS index DDL is not available on MySQL, so existing indexes are looked up instead
+def _indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if name not in _indexes(table):
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        if name in _indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,44 @@
+"""Add id to the documents and batches list indexes for cursor pagination
+
+Revision ID: 8b2e5c41a7f3
+Revises: 3f1c2a7d9b10
+Create Date: 2026-10-18 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e5c41a7f3'
+down_revision = '3f1c2a7d9b10'
+branch_labels = None
+depends_on = None
+
+# (old name, new name, table); the lists page by (created_at, id), newest first
+INDEXES = [
+    ('ix_documents_user_id_created_at', 'ix_documents_user_id_created_at_id', 'documents'),
+    ('ix_batch_processes_user_id_created_at', 'ix_batch_processes_user_id_created_at_id', 'batch_processes'),
+]
+
+
+# IF [NOT] EXISTS index DDL is not available on MySQL, so existing indexes are looked up instead
+def _indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for old_name, new_name, table in INDEXES:
+        if new_name not in _indexes(table):
+            op.create_index(new_name, table, ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+                            unique=False)
+        if old_name in _indexes(table):
+            op.drop_index(old_name, table_name=table)
+
+
+def downgrade():
+    for old_name, new_name, table in reversed(INDEXES):
+        if old_name not in _indexes(table):
+            op.create_index(old_name, table, ['user_id', sa.text('created_at DESC')], unique=False)
+        if new_name in _indexes(table):
+            op.drop_index(new_name, table_name=table)
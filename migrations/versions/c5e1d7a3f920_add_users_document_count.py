@@ -0,0 +1,37 @@
+"""Add a stored document count to users
+
+Revision ID: c5e1d7a3f920
+Revises: 8b2e5c41a7f3
+Create Date: 2026-10-18 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e1d7a3f920'
+down_revision = '8b2e5c41a7f3'
+branch_labels = None
+depends_on = None
+
+users = sa.table('users', sa.column('id', sa.Integer), sa.column('document_count', sa.Integer))
+documents = sa.table('documents', sa.column('user_id', sa.Integer))
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    if 'document_count' not in _columns('users'):
+        op.add_column('users', sa.Column('document_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Counted once here; uploads keep it up to date from now on
+    document_count = sa.select(sa.func.count()).where(documents.c.user_id == users.c.id).scalar_subquery()
+    op.execute(users.update().values(document_count=document_count))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('document_count')
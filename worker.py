@@ -0,0 +1,17 @@
+"""
+Background worker that drains the job queue (OCR + document generation).
+
+Run one or more of these alongside the web server:
+    python worker.py           # process jobs forever
+    python worker.py --burst   # exit once the queue is empty
+"""
+import sys
+
+from app import create_app
+from app.services.job_queue import run_worker
+
+
+if __name__ == "__main__":
+    # Created here rather than at import, since preprocessing pool processes re-import this module
+    app = create_app()
+    run_worker(app, burst='--burst' in sys.argv)